@@ -1,21 +1,37 @@
 """All agents used in chatbot DAG graph"""
 
 from typing import TypedDict, Annotated
+import asyncio
 import operator
-import base64
+import os
+import json
+from datetime import UTC, datetime
 
 from langchain_core.agents import AgentAction
+from langchain_core.messages import BaseMessage
 from langchain_core.tools import tool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langgraph.graph import StateGraph, END
+from langgraph.types import Send
+from weaviate.classes.query import Filter
 
 from .models import RoleTypes
 from api.utils.logger import logger
 from api.utils.vs_weaviate_utils import (
-    get_multi_vector_retriever,
+    get_object_store,
     SUMMARY_COLLECTION_NAME,
+    INCIDENT_PAGE_COLLECTION_NAME,
+)
+from api.utils.data_loader.incident_doc_loader import (
+    ANALYSIS_MAX_PAGES,
+    IncidentAnalysis,
+    analysis_key,
+    extract_incident_analysis,
+    manifest_key,
+    page_image_key,
+    image_content,
 )
 from api.utils.llm_prompts import (
     query_translation_prompt_template,
@@ -23,69 +39,136 @@ from api.utils.llm_prompts import (
     central_processor_system_prompt,
     extract_info_from_images_prompt,
 )
-from api.utils.llm_google_utils import llm
+from api.utils.llm_google_utils import llm, embedding_function
+from api.utils.tracing import span
+from api.utils.code_change_index import code_change_index
+from api.utils.metrics_store import metrics_store
+from api.utils.historical_incident_index import (
+    historical_incident_index,
+    parse_timestamp,
+)
 from api.utils.vs_weaviate_utils import (
     get_weaviate_store,
     TEXT_COLLECTION_NAME,
-    get_client,
+    weaviate_manager,
 )
 
 MAX_RETRIEVAL_RESULTS = 10
+RETRIEVAL_RESULTS_PER_QUERY = int(
+    os.environ.get("RETRIEVAL_RESULTS_PER_QUERY", "5")
+)
+# Weight of vector search in hybrid search, 0 is pure BM25 keyword search and 1 is pure vector search
+RETRIEVAL_HYBRID_ALPHA = float(os.environ.get("RETRIEVAL_HYBRID_ALPHA", "0.5"))
+# Rank constant of reciprocal rank fusion, larger value flattens the weight of top ranks
+RETRIEVAL_RRF_K = int(os.environ.get("RETRIEVAL_RRF_K", "60"))
+# Number of queries generated by query translation, original query is always searched too
+TRANSLATED_QUERIES_NUM = int(os.environ.get("TRANSLATED_QUERIES_NUM", "3"))
+# Max number of incident document pages sent to LLM
+INCIDENT_MAX_PAGES = int(os.environ.get("INCIDENT_MAX_PAGES", "3"))
+# Best matched summary may belong to document not readable any more, next ones are tried then
+INCIDENT_SEARCH_CANDIDATES = 3
+NO_ANSWER_MESSAGE = "Can't find answer"
+HISTORICAL_INCIDENT_RESULTS = int(
+    os.environ.get("HISTORICAL_INCIDENT_RESULTS", "5")
+)
+CODE_CHANGE_RESULTS = int(os.environ.get("CODE_CHANGE_RESULTS", "10"))
+COMMIT_MAX_PATHS = 5
+MONITORING_MAX_METRICS = int(os.environ.get("MONITORING_MAX_METRICS", "5"))
+# Metrics are summarized within this window before and after incident time
+MONITORING_WINDOW_SECONDS = (
+    int(os.environ.get("MONITORING_WINDOW_MINUTES", "60")) * 60
+)
+# Long free text fields of incident records are cut to keep LLM context small
+INCIDENT_RECORD_MAX_CHARS = 500
+# Run all tool calls returned by processor in one turn concurrently, otherwise only first one
+TOOL_FANOUT_ENABLED = (
+    os.environ.get("RAG_TOOL_FANOUT_ENABLED", "true").lower() == "true"
+)
 
 
 class AgentState(TypedDict):
     """Agent state used for chatbot graph, will be maintained by agent"""
 
     query: str
-    chat_history: list[str]
+    chat_history: list[BaseMessage]
     inter_steps: Annotated[list[tuple[AgentAction, str]], operator.add]
 
 
-def query_translation(query: str) -> list[str]:
-    """Use LLM to improve query content and get multiple related queries"""
+async def query_translation(query: str) -> list[str]:
+    """Use LLM to improve query content and get multiple related queries, original query is kept
+    as first one"""
 
     prompt = ChatPromptTemplate.from_template(query_translation_prompt_template)
     chain = prompt | llm | StrOutputParser() | (lambda x: x.split("\n"))
 
     try:
-        queries = chain.invoke({"query": query})
+        with span("query_translation"):
+            queries = await chain.ainvoke(
+                {"query": query, "num_queries": TRANSLATED_QUERIES_NUM}
+            )
     except Exception as e:
         logger.error(f"Failed to get related queries from LLM: {e}")
         return [query]
 
-    return queries
-
-
-def multi_queries_retriever(queries: list[str]) -> list[str]:
-    """Retrieve similar contents from vector store for all queries, each query retrieve topN results"""
-    with get_client() as client:
-        vector_store = get_weaviate_store(client, TEXT_COLLECTION_NAME)
-        docs = []
-        for query in queries:
-            results = vector_store.similarity_search_with_score(
-                query=query, k=3
-            )
-            for res, score in results:
-                docs.append((score, res.page_content))
-        docs.sort(key=lambda x: -x[0])
-        final_results = set()
-        for score, content in docs:
-            if content not in final_results:
-                final_results.add(content)
-                if len(final_results) >= MAX_RETRIEVAL_RESULTS:
-                    break
-
-        return list(final_results)
+    queries = [related for related in queries if related.strip()]
+    return [query, *queries[:TRANSLATED_QUERIES_NUM]]
+
+
+def _search_text_collection(query: str, vector: list[float]) -> list[str]:
+    """Blocking hybrid BM25 and vector search with precomputed query vector, should run in worker
+    thread. Return contents ranked from best to worst"""
+    client = weaviate_manager.get_client()
+    vector_store = get_weaviate_store(client, TEXT_COLLECTION_NAME)
+    with span("weaviate.search", collection=TEXT_COLLECTION_NAME):
+        results = vector_store.similarity_search_with_score(
+            query=query,
+            k=RETRIEVAL_RESULTS_PER_QUERY,
+            vector=vector,
+            alpha=RETRIEVAL_HYBRID_ALPHA,
+        )
+    return [res.page_content for res, _ in results]
+
+
+def reciprocal_rank_fusion(
+    ranked_results: list[list[str]], k: int = RETRIEVAL_RRF_K
+) -> list[str]:
+    """Fuse ranked results of multiple queries, each result scores 1 / (k + rank) in every list it
+    appears in. Scores of different queries are not comparable, but ranks are"""
+    scores = {}
+    for results in ranked_results:
+        for rank, content in enumerate(dict.fromkeys(results), start=1):
+            scores[content] = scores.get(content, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda content: -scores[content])
+
+
+async def multi_queries_retriever(queries: list[str]) -> list[str]:
+    """Retrieve similar contents from vector store for all queries, each query retrieve topN results
+    and results are merged with reciprocal rank fusion. All queries are embedded in one batch call,
+    then hybrid searches run concurrently"""
+    queries = [query.strip() for query in queries if query.strip()]
+    if not queries:
+        return []
+    with span("embedding", texts=len(queries)):
+        vectors = await embedding_function.aembed_documents(
+            queries, task_type="retrieval_query"
+        )
+    search_results = await asyncio.gather(
+        *(
+            asyncio.to_thread(_search_text_collection, query, vector)
+            for query, vector in zip(queries, vectors)
+        )
+    )
+    return reciprocal_rank_fusion(search_results)[:MAX_RETRIEVAL_RESULTS]
 
 
 @tool("query_relevant_engineering_documents")
-def query_relevant_engineering_documents(query: str):
+async def query_relevant_engineering_documents(query: str):
     """Search query related engineering guidelines from given vector store and return them"""
 
-    enhanced_queries = query_translation(query)
+    enhanced_queries = await query_translation(query)
     retrieved_context = ""
     try:
-        retrieved_results = multi_queries_retriever(enhanced_queries)
+        retrieved_results = await multi_queries_retriever(enhanced_queries)
     except Exception as e:
         logger.error(
             f"Failed to retrieve results from vector store for queries {enhanced_queries}: {e}"
@@ -97,65 +180,270 @@ def query_relevant_engineering_documents(query: str):
     return f"Data Source: Engineering documents\nRelated Information: {retrieved_context}\n"
 
 
-@tool("query_relevant_incident_analysis_documents")
-def query_relevant_incident_analysis_documents(query: str):
-    """Retrieve query related summaries from vector database, then feed related incident analysis
-    PDF document in images as context to LLM, to extract query related incident troubleshooting
-    information from document and return it"""
-    with get_client() as client:
-        multi_retriever = get_multi_vector_retriever(
-            client=client, collection_name=SUMMARY_COLLECTION_NAME
+def _find_incident_document(
+    query: str, vector: list[float]
+) -> tuple[str, dict] | None:
+    """Blocking search of best matched incident document, should run in worker thread.
+    Return document id and its manifest"""
+    client = weaviate_manager.get_client()
+    summary_store = get_weaviate_store(client, SUMMARY_COLLECTION_NAME)
+    with span("weaviate.search", collection=SUMMARY_COLLECTION_NAME):
+        summaries = summary_store.similarity_search(
+            query, k=INCIDENT_SEARCH_CANDIDATES, vector=vector
         )
-        results = multi_retriever.invoke(query)
-        if not results:
-            return "Data source: incident analysis documents\nResult: No relevant information"
-        image = base64.b64encode(results[0]).decode("utf-8")
+    doc_ids = [summary.metadata["doc_id"] for summary in summaries]
+    manifests = get_object_store().mget(
+        [manifest_key(doc_id) for doc_id in doc_ids]
+    )
+    for doc_id, manifest in zip(doc_ids, manifests):
+        if manifest is not None:
+            return doc_id, json.loads(manifest)
+        logger.warning(f"Missing manifest of incident document {doc_id}")
+    return None
+
+
+def _retrieve_incident_pages(
+    query: str, vector: list[float], doc_id: str, manifest: dict
+) -> list[bytes]:
+    """Blocking retrieval of query relevant page images of incident document, should run in
+    worker thread"""
+    client = weaviate_manager.get_client()
+    page_store = get_weaviate_store(client, INCIDENT_PAGE_COLLECTION_NAME)
+    with span("weaviate.search", collection=INCIDENT_PAGE_COLLECTION_NAME):
+        relevant_pages = page_store.similarity_search(
+            query,
+            k=INCIDENT_MAX_PAGES,
+            vector=vector,
+            filters=Filter.by_property("doc_id").equal(doc_id),
+        )
+    page_numbers = sorted(
+        {int(page.metadata["page"]) for page in relevant_pages}
+    )
+    # Pages without text (like scanned document) are not indexed, fall back to first pages
+    if not page_numbers:
+        page_numbers = list(range(min(INCIDENT_MAX_PAGES, manifest["pages"])))
+    return _load_incident_page_images(doc_id, manifest, page_numbers)
 
-        human_messages = [
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{image}"},
-            }
-        ]
-        messages = [
-            (RoleTypes.SYSTEM, extract_info_from_images_prompt),
-            (RoleTypes.HUMAN, human_messages),
-        ]
 
-        try:
-            response = llm.invoke(messages)
-            logger.info(
-                f"Successfully extract information from images {response.content}"
-            )
-        except Exception as e:
-            logger.error(
-                f"Failed to retrieve information from images with LLM: {e}"
+def _load_incident_page_images(
+    doc_id: str, manifest: dict, page_numbers: list[int]
+) -> list[bytes]:
+    images = get_object_store().mget(
+        [
+            page_image_key(doc_id, page, manifest["image_format"])
+            for page in page_numbers
+        ]
+    )
+    return [image for image in images if image]
+
+
+async def _get_incident_analysis(
+    doc_id: str, manifest: dict
+) -> IncidentAnalysis | None:
+    """Get analysis of incident document from object store, documents ingested without analysis
+    are extracted on first access and saved, so multimodal LLM call is done once per document"""
+    object_store = get_object_store()
+    cached = (await object_store.amget([analysis_key(doc_id)]))[0]
+    if cached is not None:
+        return IncidentAnalysis.model_validate_json(cached)
+
+    page_numbers = list(range(min(ANALYSIS_MAX_PAGES, manifest["pages"])))
+    images = await asyncio.to_thread(
+        _load_incident_page_images, doc_id, manifest, page_numbers
+    )
+    if not images:
+        return None
+    try:
+        analysis = await extract_incident_analysis(
+            images, manifest["mime_type"]
+        )
+        if analysis is None:
+            logger.warning(
+                f"LLM returned no analysis of incident document {doc_id}"
             )
-            return "Data source: incident analysis documents\nResult: No relevant information"
+            return None
+        await object_store.amset(
+            [(analysis_key(doc_id), analysis.model_dump_json().encode())]
+        )
+    except Exception as e:
+        logger.error(
+            f"Failed to extract analysis of incident document {doc_id}: {e}"
+        )
+        return None
+    logger.info(f"Saved extracted analysis of incident document {doc_id}")
+    return analysis
+
+
+@tool("query_relevant_incident_analysis_documents")
+async def query_relevant_incident_analysis_documents(query: str):
+    """Retrieve query related summaries from vector database, then return extracted incident
+    troubleshooting information of related incident analysis document. Falls back to feed query
+    relevant pages of document in images as context to LLM if extracted analysis is unavailable"""
+    no_result = "Data source: incident analysis documents\nResult: No relevant information"
+    with span("embedding", texts=1):
+        vector = await embedding_function.aembed_query(query)
+    document = await asyncio.to_thread(_find_incident_document, query, vector)
+    if document is None:
+        return no_result
+    doc_id, manifest = document
+
+    analysis = await _get_incident_analysis(doc_id, manifest)
+    if analysis is not None:
+        return analysis.to_context()
+
+    images = await asyncio.to_thread(
+        _retrieve_incident_pages, query, vector, doc_id, manifest
+    )
+    if not images:
+        return no_result
+
+    human_messages = [
+        image_content(image, manifest["mime_type"]) for image in images
+    ]
+    messages = [
+        (RoleTypes.SYSTEM, extract_info_from_images_prompt),
+        (RoleTypes.HUMAN, human_messages),
+    ]
+
+    try:
+        response = await llm.ainvoke(messages)
+        logger.info("Successfully extract information from images")
+        logger.debug("Extracted information: %s", response.content)
+    except Exception as e:
+        logger.error(
+            f"Failed to retrieve information from images with LLM: {e}"
+        )
+        return no_result
 
-        return response.content
+    return response.content
+
+
+def format_incident_record(record: dict) -> str:
+    started_at = parse_timestamp(record.get("started_at"))
+    header = ", ".join(
+        value
+        for value in (
+            record.get("service"),
+            record.get("severity") and f"severity {record['severity']}",
+            started_at
+            and f"started {datetime.fromtimestamp(started_at, UTC).isoformat()}",
+        )
+        if value
+    )
+    lines = [
+        f"Incident {record.get('id', '')} ({header}): {record.get('title', '')}"
+    ]
+    for field, label in (
+        ("description", "Description"),
+        ("root_cause", "Root cause"),
+        ("resolution", "Resolution"),
+    ):
+        if record.get(field):
+            lines.append(
+                f"{label}: {str(record[field])[:INCIDENT_RECORD_MAX_CHARS]}"
+            )
+    return "\n".join(lines)
 
 
 @tool("query_relevant_historical_incidents")
-def query_relevant_historical_incidents(query: str):
-    """Find query related historical incidents from elastic search database"""
-    return "Data source: historical incident records\nResult: No relevant information"
+async def query_relevant_historical_incidents(
+    query: str, service: str = "", start_time: str = "", end_time: str = ""
+):
+    """Find query related historical incidents from historical incident records, optionally only
+    incidents of given service, or started between start_time and end_time in ISO 8601 format"""
+    no_result = "Data source: historical incident records\nResult: No relevant information"
+    try:
+        results = await asyncio.to_thread(
+            historical_incident_index.search,
+            query,
+            HISTORICAL_INCIDENT_RESULTS,
+            [service] if service else None,
+            parse_timestamp(start_time),
+            parse_timestamp(end_time),
+        )
+    except Exception as e:
+        logger.error(f"Failed to search historical incidents: {e}")
+        return no_result
+    if not results:
+        return no_result
+    records = "\n\n".join(
+        format_incident_record(record) for _, record in results
+    )
+    return f"Data source: historical incident records\nRelated Information:\n{records}\n"
+
+
+def format_commit(commit: dict) -> str:
+    changed_at = datetime.fromtimestamp(commit["time"], UTC).isoformat()
+    paths = ", ".join(commit["paths"][:COMMIT_MAX_PATHS])
+    if len(commit["paths"]) > COMMIT_MAX_PATHS:
+        paths += f" and {len(commit['paths']) - COMMIT_MAX_PATHS} more"
+    return (
+        f"{changed_at} {commit['repo']}@{commit['sha'][:10]} by {commit['author']}: "
+        f"{commit['subject']} ({commit['files']} files, +{commit['insertions']} "
+        f"-{commit['deletions']})\nChanged paths: {paths}"
+    )
 
 
 @tool("query_relevant_code_change_history")
-def query_relevant_code_change_history(query: str):
-    """Find query related code change history from GitHub"""
-    return "Data source: code change history\nResult: No relevant information"
+async def query_relevant_code_change_history(
+    query: str, path_prefix: str = "", start_time: str = "", end_time: str = ""
+):
+    """Find query related code change history from git repositories, optionally only changes to
+    paths starting with path_prefix, or committed between start_time and end_time in ISO 8601 format"""
+    no_result = (
+        "Data source: code change history\nResult: No relevant information"
+    )
+    try:
+        commits = await asyncio.to_thread(
+            code_change_index.search,
+            query,
+            parse_timestamp(start_time),
+            parse_timestamp(end_time),
+            path_prefix or None,
+            CODE_CHANGE_RESULTS,
+        )
+    except Exception as e:
+        logger.error(f"Failed to search code change history: {e}")
+        return no_result
+    if not commits:
+        return no_result
+    changes = "\n".join(format_commit(commit) for commit in commits)
+    return (
+        f"Data source: code change history\nRelated Information:\n{changes}\n"
+    )
 
 
 @tool("query_relevant_application_monitoring_data")
-def query_relevant_application_monitoring_data(query: str):
-    """Find query related application monitoring data from DataDog"""
-    return "Data source: application monitoring data\nResult: No relevant information"
+async def query_relevant_application_monitoring_data(
+    query: str, service: str = "", incident_time: str = ""
+):
+    """Find query related application monitoring metrics and summarize them around incident_time
+    in ISO 8601 format (latest data if not set): percentiles before and after it, and detected
+    change point. Optionally only metrics of given service"""
+    no_result = "Data source: application monitoring data\nResult: No relevant information"
+
+    def summarize_metrics() -> list[str]:
+        around_time = parse_timestamp(incident_time)
+        return [
+            metrics_store.summarize(key, around_time, MONITORING_WINDOW_SECONDS)
+            for key in metrics_store.find_metrics(
+                query, service, MONITORING_MAX_METRICS
+            )
+        ]
+
+    try:
+        summaries = await asyncio.to_thread(summarize_metrics)
+    except Exception as e:
+        logger.error(f"Failed to summarize monitoring data: {e}")
+        return no_result
+    if not summaries:
+        return no_result
+    metrics = "\n".join(summaries)
+    return f"Data source: application monitoring data\nRelated Information:\n{metrics}\n"
 
 
 @tool("final_answer")
-def final_answer(query: str, context: str) -> str:
+async def final_answer(query: str, context: str) -> str:
     """Return a nature language response to the user, based on original user query and aggregated context \
     from all tools outputs, use LLM to get final answer for query"""
 
@@ -170,11 +458,11 @@ def final_answer(query: str, context: str) -> str:
             | llm
             | StrOutputParser()
         )
-        answer = chain.invoke({"query": query, "context": context})
+        answer = await chain.ainvoke({"query": query, "context": context})
         logger.info("Successfully get final answer with LLM")
     except Exception as e:
         logger.error(f"Failed to get final answer with LLM: {e}")
-        return "Can't find answer"
+        return NO_ANSWER_MESSAGE
 
     return answer
 
@@ -191,17 +479,49 @@ def create_scratchpad(inter_steps: list[AgentAction]):
     return "\n-----------\n".join(analysis_steps)
 
 
-def router(state: AgentState) -> str:
-    """return the tool name to use, if bad format got to final answer"""
+def pending_actions(inter_steps: list[AgentAction]) -> list[AgentAction]:
+    """Get actions chosen by processor in last turn which are not executed yet"""
+    actions = []
+    for action in reversed(inter_steps):
+        if action.log != "TBD":
+            break
+        actions.append(action)
+    actions.reverse()
+    return actions
+
+
+def router(state: AgentState) -> list[Send]:
+    """Send each tool call chosen by processor to its tool node, they run concurrently.
+    If bad format go to final answer with outputs collected so far"""
+    context = ""
     if isinstance(state["inter_steps"], list):
-        return state["inter_steps"][-1].tool
-    else:
-        logger.info("Invalid route format")
-        return "final_answer"
+        actions = pending_actions(state["inter_steps"])
+        if actions:
+            return [Send(action.tool, {"action": action}) for action in actions]
+        context = create_scratchpad(state["inter_steps"])
+    logger.info("Invalid route format")
+    return [
+        Send(
+            "final_answer",
+            {
+                "action": AgentAction(
+                    tool="final_answer",
+                    tool_input={"query": state["query"], "context": context},
+                    log="TBD",
+                )
+            },
+        )
+    ]
+
+
+class ToolCallState(TypedDict):
+    """Input of tool node, one tool call chosen by processor"""
 
+    action: AgentAction
 
-def run_tool(state: AgentState):
-    """Run tool node based on last state value"""
+
+async def run_tool(state: ToolCallState):
+    """Run tool node with tool call sent by router"""
     tool_str_to_function = {
         "query_relevant_engineering_documents": query_relevant_engineering_documents,
         "query_relevant_incident_analysis_documents": query_relevant_incident_analysis_documents,
@@ -211,16 +531,29 @@ def run_tool(state: AgentState):
         "final_answer": final_answer,
     }
 
-    tool_name = state["inter_steps"][-1].tool
-    tool_args = state["inter_steps"][-1].tool_input
+    tool_name = state["action"].tool
+    tool_args = state["action"].tool_input
 
-    response = tool_str_to_function[tool_name].invoke(input=tool_args)
+    with span(f"tool.{tool_name}"):
+        response = await tool_str_to_function[tool_name].ainvoke(
+            input=tool_args
+        )
     action_output = AgentAction(
         tool=tool_name, tool_input=tool_args, log=str(response)
     )
     return {"inter_steps": [action_output]}
 
 
+TOOL_NODE_NAMES = {
+    "query_relevant_engineering_documents",
+    "query_relevant_incident_analysis_documents",
+    "query_relevant_historical_incidents",
+    "query_relevant_code_change_history",
+    "query_relevant_application_monitoring_data",
+    "final_answer",
+}
+
+
 def build_rag_graph():
     """Build adaptive RAG graph with all agent tools"""
 
@@ -253,18 +586,34 @@ def build_rag_graph():
     )
 
     # Define the run central process function
-    def run_processor(state: AgentState):
-        logger.info("run processor")
-        logger.info(f"inter_steps: {state['inter_steps']}")
-        response = processor_chain.invoke(state)
-        tool_name = response.tool_calls[0]["name"]
-        tool_args = response.tool_calls[0]["args"]
-        action_output = AgentAction(
-            tool=tool_name, tool_input=tool_args, log="TBD"
-        )
-
-        logger.info(f"Next tool: {tool_name}, tool input: {tool_args}")
-        return {"inter_steps": [action_output]}
+    async def run_processor(state: AgentState):
+        # Steps include retrieved context, build message only if debug logging is on
+        logger.debug("run processor, inter_steps: %s", state["inter_steps"])
+        with span("graph.processor"):
+            response = await processor_chain.ainvoke(state)
+        tool_calls = response.tool_calls
+        if not TOOL_FANOUT_ENABLED:
+            tool_calls = tool_calls[:1]
+        # final answer only makes sense after other tools in same turn returned their outputs
+        if len(tool_calls) > 1:
+            tool_calls = [
+                tool_call
+                for tool_call in tool_calls
+                if tool_call["name"] != "final_answer"
+            ]
+        actions = []
+        for tool_call in tool_calls:
+            actions.append(
+                AgentAction(
+                    tool=tool_call["name"],
+                    tool_input=tool_call["args"],
+                    log="TBD",
+                )
+            )
+            logger.info(
+                f"Next tool: {tool_call['name']}, tool input: {tool_call['args']}"
+            )
+        return {"inter_steps": actions}
 
     graph_builder = StateGraph(AgentState)
     graph_builder.add_node("processor", run_processor)
@@ -279,7 +628,11 @@ def build_rag_graph():
     )
     graph_builder.add_node("final_answer", run_tool)
     graph_builder.set_entry_point("processor")
-    graph_builder.add_conditional_edges(source="processor", path=router)
+    graph_builder.add_conditional_edges(
+        source="processor",
+        path=router,
+        path_map=[tool_object.name for tool_object in tools],
+    )
     for tool_object in tools:
         if tool_object.name != "final_answer":
             graph_builder.add_edge(tool_object.name, "processor")
@@ -1,26 +1,68 @@
 """API endpoints related to chatbot services"""
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 
 from .services import (
+    RETRIEVE_CHATS_NUM,
+    MAX_RETRIEVE_CHATS_NUM,
     gen_ai_completion,
+    stream_ai_completion,
     get_chat_history,
-    gen_knowledgebase,
+    submit_knowledgebase_job,
+    get_knowledgebase_job,
+    reload_rag_graph,
+    get_service_metrics,
+    get_trace_stats,
 )
-from .schemas import ChatCompletionRequest
+from .schemas import (
+    ChatCompletionRequest,
+    ChatHistoryPage,
+    IngestionJobStatus,
+)
+from .ingestion_jobs import IngestionQueueFullError
 from api.dependencies.db import DBSessionDep
-from api.dependencies.auth import CurrentUserDep, valid_is_authenticated
+from api.dependencies.auth import (
+    CurrentUserDep,
+    valid_is_authenticated,
+    valid_is_admin,
+)
 
 ai_sre_router = APIRouter()
 
 
 @ai_sre_router.post(
-    "/gen-knowledgebase", dependencies=[Depends(valid_is_authenticated)]
+    "/gen-knowledgebase",
+    response_model=IngestionJobStatus,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(valid_is_authenticated)],
 )
-async def gen_knowledgebase_api(db: DBSessionDep):
-    """Generate RAG knowledge base from input webs and docs, and save into vector database"""
-    result = await gen_knowledgebase(db)
-    return result
+async def gen_knowledgebase_api():
+    """Submit background job to generate RAG knowledge base from input webs and docs, and save into
+    vector database. Return active job if knowledge base is already being generated"""
+    try:
+        job_status = submit_knowledgebase_job()
+    except IngestionQueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e)
+        )
+    return job_status
+
+
+@ai_sre_router.get(
+    "/gen-knowledgebase/{job_id}",
+    response_model=IngestionJobStatus,
+    dependencies=[Depends(valid_is_authenticated)],
+)
+async def gen_knowledgebase_job_api(job_id: str):
+    """Get progress of knowledge base generation job"""
+    job_status = get_knowledgebase_job(job_id)
+    if job_status is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Ingestion job {job_id} not found",
+        )
+    return job_status
 
 
 @ai_sre_router.post(
@@ -35,10 +77,56 @@ async def chat_completion(
     return {"chat_completion": completion}
 
 
+@ai_sre_router.post(
+    "/chat-completion/stream", dependencies=[Depends(valid_is_authenticated)]
+)
+async def chat_completion_stream(
+    chat_input: ChatCompletionRequest, user: CurrentUserDep
+):
+    """Stream AI completion as server-sent events, including tool progress and final answer tokens"""
+    return StreamingResponse(
+        stream_ai_completion(user.id, chat_input.query),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @ai_sre_router.get(
-    "/chat-history", dependencies=[Depends(valid_is_authenticated)]
+    "/chat-history",
+    response_model=ChatHistoryPage,
+    dependencies=[Depends(valid_is_authenticated)],
 )
-async def chat_history(db: DBSessionDep, user: CurrentUserDep):
-    """Load chat history belong to current user"""
-    chats = await get_chat_history(db, user.id)
-    return {"chat_history": chats}
+async def chat_history(
+    db: DBSessionDep,
+    user: CurrentUserDep,
+    limit: int = Query(RETRIEVE_CHATS_NUM, ge=1, le=MAX_RETRIEVE_CHATS_NUM),
+    before: str | None = None,
+):
+    """Load chat history belong to current user page by page, latest chats first. Use next_cursor
+    of response as before to load older chats"""
+    try:
+        return await get_chat_history(db, user.id, limit, before)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)
+        )
+
+
+@ai_sre_router.post("/reload-graph", dependencies=[Depends(valid_is_admin)])
+async def reload_graph():
+    """Rebuild compiled RAG graph after prompts or tools changed"""
+    graph_stats = await reload_rag_graph()
+    return {"rag_graph": graph_stats}
+
+
+@ai_sre_router.get("/metrics", dependencies=[Depends(valid_is_admin)])
+async def service_metrics():
+    """Runtime metrics of chatbot services, like RAG graph build cost"""
+    return get_service_metrics()
+
+
+@ai_sre_router.get("/trace-stats", dependencies=[Depends(valid_is_admin)])
+async def trace_stats():
+    """Latency p50/p95 of request stages like graph nodes, LLM calls, vector searches and DB
+    writes, with span trees of latest requests"""
+    return get_trace_stats()
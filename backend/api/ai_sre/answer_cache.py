@@ -0,0 +1,151 @@
+"""Semantic cache of AI completions, near-identical questions reuse previous completion instead of running RAG graph"""
+
+import os
+import time
+
+import numpy as np
+
+from api.utils.logger import logger
+from api.utils.llm_google_utils import embedding_function
+from api.utils.tracing import span
+
+
+class SemanticAnswerCache:
+    """Keep recent (query embedding, completion) pairs, find cached completion by cosine similarity"""
+
+    def __init__(
+        self,
+        enabled: bool,
+        similarity_threshold: float,
+        ttl_seconds: float,
+        max_entries: int,
+    ):
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._queries: list[str] = []
+        self._completions: list[str] = []
+        self._expires_at = np.empty(0, dtype=np.float64)
+        # Bumped on invalidate, completion computed before that is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def _embed(self, query: str) -> np.ndarray | None:
+        try:
+            with span("embedding", texts=1):
+                vector = await embedding_function.aembed_query(query)
+        except Exception as e:
+            logger.warning(f"Failed to embed query for answer cache: {e}")
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _evict_expired(self):
+        if not self._completions:
+            return
+        alive = self._expires_at > time.monotonic()
+        if alive.all():
+            return
+        indexes = np.flatnonzero(alive)
+        self._vectors = self._vectors[indexes]
+        self._expires_at = self._expires_at[indexes]
+        self._queries = [self._queries[i] for i in indexes]
+        self._completions = [self._completions[i] for i in indexes]
+
+    async def lookup(self, query: str) -> str | None:
+        """Return cached completion of most similar previous query, if similarity above threshold"""
+        if not self.enabled:
+            return None
+        self._evict_expired()
+        if not self._completions:
+            self.misses += 1
+            return None
+        # Entries may be evicted while query is embedded, search snapshot taken before.
+        # Entries invalidated meanwhile are stale, lookup is a miss then
+        generation = self.generation
+        vectors, queries, completions = (
+            self._vectors,
+            self._queries,
+            self._completions,
+        )
+        vector = await self._embed(query)
+        if (
+            vector is None
+            or generation != self.generation
+            or vectors.shape[1] != vector.shape[0]
+        ):
+            self.misses += 1
+            return None
+
+        similarities = vectors @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(
+            f"Answer cache hit for query '{query}', similar to '{queries[best]}' ({similarities[best]:.3f})"
+        )
+        return completions[best]
+
+    async def store(
+        self, query: str, completion: str, generation: int | None = None
+    ):
+        """Cache completion, unless cache was invalidated since generation was read before computing it"""
+        if generation is None:
+            generation = self.generation
+        if not self.enabled or generation != self.generation:
+            return
+        vector = await self._embed(query)
+        if vector is None or generation != self.generation:
+            return
+        self._evict_expired()
+        if self._completions and self._vectors.shape[1] == vector.shape[0]:
+            self._vectors = np.vstack([self._vectors, vector])
+        else:
+            self._vectors = vector.reshape(1, -1)
+            self._queries, self._completions = [], []
+            self._expires_at = np.empty(0, dtype=np.float64)
+        self._queries.append(query)
+        self._completions.append(completion)
+        self._expires_at = np.append(
+            self._expires_at, time.monotonic() + self.ttl_seconds
+        )
+        # Oldest entries are at the beginning
+        if len(self._completions) > self.max_entries:
+            overflow = len(self._completions) - self.max_entries
+            self._vectors = self._vectors[overflow:]
+            self._expires_at = self._expires_at[overflow:]
+            self._queries = self._queries[overflow:]
+            self._completions = self._completions[overflow:]
+
+    def invalidate(self):
+        """Drop all cached completions, called when knowledge base changed"""
+        if self._completions:
+            logger.info(f"Invalidate {len(self._completions)} cached answers")
+        self.generation += 1
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._queries, self._completions = [], []
+        self._expires_at = np.empty(0, dtype=np.float64)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._completions),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+answer_cache = SemanticAnswerCache(
+    enabled=os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true",
+    similarity_threshold=float(
+        os.environ.get("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95")
+    ),
+    ttl_seconds=float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "600")),
+    max_entries=int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+)
@@ -0,0 +1,163 @@
+"""Bounded conversational memory fed into RAG graph: latest chats within token budget, older chats
+folded into rolling summary saved per user. Summary is updated incrementally in background with
+only chats newly moved out of window, so history is never re-fetched or re-sent as a whole"""
+
+import asyncio
+import contextvars
+import os
+from dataclasses import dataclass, field
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+)
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database.db import session_manager
+from api.utils.llm_google_utils import llm
+from api.utils.llm_prompts import chat_summary_prompt_template
+from api.utils.logger import logger
+from api.utils.tracing import span
+from .chat_writer import chat_writer
+from .models import Chat as ChatModel, ChatSummary, RoleTypes
+
+CHAT_MEMORY_ENABLED = (
+    os.environ.get("CHAT_MEMORY_ENABLED", "true").lower() == "true"
+)
+CHAT_MEMORY_TOKEN_BUDGET = int(
+    os.environ.get("CHAT_MEMORY_TOKEN_BUDGET", "1500")
+)
+# Max chats loaded for window, and max older chats folded into summary per request
+CHAT_MEMORY_MAX_CHATS = int(os.environ.get("CHAT_MEMORY_MAX_CHATS", "20"))
+# Chats out of window are kept in it until they are worth one summary LLM call
+CHAT_SUMMARY_MIN_TOKENS = int(os.environ.get("CHAT_SUMMARY_MIN_TOKENS", "500"))
+
+_summary_tasks: set[asyncio.Task] = set()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token"""
+    return len(text) // 4 + 1
+
+
+def question_start(chats: list[ChatModel], start: int) -> int:
+    """First index from start where window can begin, window always starts with question"""
+    while start < len(chats) and chats[start].role_type != RoleTypes.HUMAN:
+        start += 1
+    return start
+
+
+@dataclass
+class ChatMemory:
+    messages: list[BaseMessage] = field(default_factory=list)
+    summary: str = ""
+    summarized_until_id: int = 0
+    # (id, role_type, content) of chats to fold into summary, copied as chat models expire on commit
+    evicted_chats: list[tuple[int, str, str]] = field(default_factory=list)
+
+
+async def load_chat_memory(db: AsyncSession, user_id: int) -> ChatMemory:
+    """Load rolling summary and latest chats not in summary yet, keep newest turns within token
+    budget and mark older ones to be folded into summary. Chats not in summary yet but older
+    than latest loaded chats are always folded into summary, oldest first, so no chat is
+    skipped"""
+    if not CHAT_MEMORY_ENABLED:
+        return ChatMemory()
+    # Latest pairs of user may still be in write-behind queue
+    await chat_writer.flush_user(user_id)
+    with span("db.load_chat_memory"):
+        summary_record = await ChatSummary.find_by_userid(db, user_id)
+        summary = summary_record.summary if summary_record else ""
+        summarized_until_id = (
+            summary_record.summarized_until_id if summary_record else 0
+        )
+        chats = await ChatModel.find_recent_chat_history(
+            db, user_id, CHAT_MEMORY_MAX_CHATS, after_id=summarized_until_id
+        )
+        older_chats = []
+        if len(chats) >= CHAT_MEMORY_MAX_CHATS:
+            older_chats = await ChatModel.find_chats_between(
+                db,
+                user_id,
+                summarized_until_id,
+                chats[0].id,
+                CHAT_MEMORY_MAX_CHATS,
+            )
+
+    budget = CHAT_MEMORY_TOKEN_BUDGET - estimate_tokens(summary)
+    window_start = len(chats)
+    for index in range(len(chats) - 1, -1, -1):
+        budget -= estimate_tokens(chats[index].content)
+        if budget < 0:
+            break
+        window_start = index
+    window_start = question_start(chats, window_start)
+
+    if len(older_chats) >= CHAT_MEMORY_MAX_CHATS:
+        # More chats between these and loaded ones, summary must stay contiguous, so loaded
+        # chats out of window are folded on later requests
+        evicted = older_chats
+    else:
+        evicted = older_chats + chats[:window_start]
+    evicted_chats = [
+        (chat.id, str(chat.role_type), chat.content) for chat in evicted
+    ]
+    if (
+        not older_chats
+        and sum(estimate_tokens(content) for _, _, content in evicted_chats)
+        < CHAT_SUMMARY_MIN_TOKENS
+    ):
+        evicted_chats = []
+        window_start = question_start(chats, 0)
+
+    messages = []
+    if summary:
+        messages.append(
+            SystemMessage(content=f"Summary of earlier conversation: {summary}")
+        )
+    for chat in chats[window_start:]:
+        if chat.role_type == RoleTypes.HUMAN:
+            messages.append(HumanMessage(content=chat.content))
+        else:
+            messages.append(AIMessage(content=chat.content))
+    return ChatMemory(messages, summary, summarized_until_id, evicted_chats)
+
+
+async def update_chat_summary(user_id: int, memory: ChatMemory):
+    """Fold chats moved out of memory window into user's rolling summary"""
+    turns = "\n".join(
+        f"{role_type}: {content}"
+        for _, role_type, content in memory.evicted_chats
+    )
+    until_id = memory.evicted_chats[-1][0]
+    try:
+        prompt = ChatPromptTemplate.from_template(chat_summary_prompt_template)
+        chain = prompt | llm | StrOutputParser()
+        summary = await chain.ainvoke(
+            {"summary": memory.summary or "None", "turns": turns}
+        )
+        async with session_manager.session() as db:
+            current = await ChatSummary.find_by_userid(db, user_id)
+            # Concurrent request of same user already summarized these chats
+            if current and current.summarized_until_id >= until_id:
+                return
+            await ChatSummary.save(db, user_id, summary, until_id)
+        logger.info(f"Updated chat summary of user {user_id}")
+    except Exception as e:
+        logger.error(f"Failed to update chat summary of user {user_id}: {e}")
+
+
+def schedule_chat_summary_update(user_id: int, memory: ChatMemory):
+    """Update summary in background, it is not needed by current answer"""
+    if not memory.evicted_chats:
+        return
+    # Fresh context, so summary LLM call is not traced as part of request
+    task = asyncio.create_task(
+        update_chat_summary(user_id, memory), context=contextvars.Context()
+    )
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
@@ -0,0 +1,141 @@
+"""Chat persistence, question and answer of one completion are written together in one transaction.
+With write-behind enabled, pairs are queued and written in batches by background worker, so DB
+latency is out of response path. Queued pairs are not in DB yet, chat memory waits for pairs of
+its user to be written, chat history page may miss them for a moment"""
+
+import asyncio
+import os
+from collections import Counter
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.database.db import session_manager
+from api.utils.logger import logger
+from api.utils.tracing import span
+from .models import Chat as ChatModel
+
+CHAT_WRITE_BEHIND_ENABLED = (
+    os.environ.get("CHAT_WRITE_BEHIND_ENABLED", "false").lower() == "true"
+)
+CHAT_WRITE_QUEUE_SIZE = int(os.environ.get("CHAT_WRITE_QUEUE_SIZE", "1000"))
+CHAT_WRITE_BATCH_SIZE = int(os.environ.get("CHAT_WRITE_BATCH_SIZE", "100"))
+# Longest wait for queued pairs of user before loading chat memory without them
+CHAT_WRITE_FLUSH_TIMEOUT_SECONDS = 5
+
+
+class ChatWriter:
+    """Write chat pairs directly or through write-behind queue. Queue is flushed when stopped,
+    pairs are written directly when queue is full"""
+
+    def __init__(self, write_behind: bool, queue_size: int, batch_size: int):
+        self.write_behind = write_behind
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue | None = None
+        self._worker_task: asyncio.Task | None = None
+        # Queued pairs per user, writes notify waiters of flush_user
+        self._queued_users: Counter[int] = Counter()
+        self._flushed: asyncio.Condition | None = None
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+
+    def start(self):
+        if not self.write_behind:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._flushed = asyncio.Condition()
+        self._worker_task = asyncio.create_task(self._work())
+
+    async def stop(self):
+        if self._worker_task is None:
+            return
+        # Write all queued pairs before shutdown
+        await self._queue.join()
+        self._worker_task.cancel()
+        await asyncio.gather(self._worker_task, return_exceptions=True)
+        self._worker_task = None
+        self._queue = None
+
+    async def save_pair(
+        self,
+        user_id: int,
+        question: str,
+        answer: str,
+        db: AsyncSession | None = None,
+    ):
+        """Save question and answer of one completion, db session is used for direct write if given"""
+        pair = (user_id, question, answer)
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(pair)
+                self._queued_users[user_id] += 1
+                return
+            except asyncio.QueueFull:
+                logger.warning("Chat write queue is full, write chats directly")
+        with span("db.save_chats"):
+            if db is not None:
+                await self._write(db, [pair])
+            else:
+                async with session_manager.session() as session:
+                    await self._write(session, [pair])
+
+    async def flush_user(self, user_id: int):
+        """Wait until queued pairs of user are written, so they are seen by next DB read"""
+        if self._flushed is None or not self._queued_users[user_id]:
+            return
+        with span("chat_writer.flush_user"):
+            try:
+                async with self._flushed:
+                    await asyncio.wait_for(
+                        self._flushed.wait_for(
+                            lambda: not self._queued_users[user_id]
+                        ),
+                        CHAT_WRITE_FLUSH_TIMEOUT_SECONDS,
+                    )
+            except TimeoutError:
+                logger.warning(
+                    f"Queued chats of user {user_id} not written in time, read without them"
+                )
+
+    async def _write(self, db: AsyncSession, pairs: list[tuple[int, str, str]]):
+        try:
+            await ChatModel.create_pairs(db, pairs)
+        except Exception:
+            self._failed += len(pairs)
+            raise
+        self._written += len(pairs)
+        self._batches += 1
+
+    async def _work(self):
+        while True:
+            pairs = [await self._queue.get()]
+            while len(pairs) < self.batch_size and not self._queue.empty():
+                pairs.append(self._queue.get_nowait())
+            try:
+                async with session_manager.session() as db:
+                    await self._write(db, pairs)
+            except Exception as e:
+                logger.error(f"Failed to write {len(pairs)} chat pairs: {e}")
+            finally:
+                for user_id, _, _ in pairs:
+                    self._queued_users[user_id] -= 1
+                    if self._queued_users[user_id] <= 0:
+                        del self._queued_users[user_id]
+                    self._queue.task_done()
+                async with self._flushed:
+                    self._flushed.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "write_behind": self.write_behind,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "written_pairs": self._written,
+            "failed_pairs": self._failed,
+            "batches": self._batches,
+        }
+
+
+chat_writer = ChatWriter(
+    CHAT_WRITE_BEHIND_ENABLED, CHAT_WRITE_QUEUE_SIZE, CHAT_WRITE_BATCH_SIZE
+)
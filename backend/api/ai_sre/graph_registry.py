@@ -0,0 +1,69 @@
+"""Process wide registry of compiled RAG graph, built once on app startup and shared by all requests"""
+
+import importlib
+import threading
+import time
+from datetime import datetime, UTC
+
+from langgraph.graph.state import CompiledStateGraph
+
+from api.utils import llm_prompts
+from api.utils.logger import logger
+from . import agents
+
+
+class RAGGraphRegistry:
+    """Hold compiled adaptive RAG graph, support explicit hot reload when prompts or tools changed"""
+
+    def __init__(self):
+        self._graph: CompiledStateGraph | None = None
+        self._lock = threading.Lock()
+        self.version = 0
+        self.built_at: datetime | None = None
+        self.last_build_seconds: float | None = None
+
+    def build(self) -> CompiledStateGraph:
+        """Build and compile graph, replace current one once compiled successfully"""
+        with self._lock:
+            return self._build_locked()
+
+    def _build_locked(self) -> CompiledStateGraph:
+        start = time.perf_counter()
+        graph = agents.build_rag_graph()
+        duration = time.perf_counter() - start
+
+        self._graph = graph
+        self.version += 1
+        self.built_at = datetime.now(UTC)
+        self.last_build_seconds = duration
+        logger.info(
+            f"Compiled RAG graph version {self.version} in {duration * 1000:.1f} ms"
+        )
+        return graph
+
+    def get(self) -> CompiledStateGraph:
+        """Get compiled graph, lazily build it if app startup did not build it"""
+        graph = self._graph
+        if graph is None:
+            with self._lock:
+                graph = self._graph or self._build_locked()
+        return graph
+
+    def reload(self) -> CompiledStateGraph:
+        """Re-read prompts and agent tools (with their config) from source and rebuild graph,
+        in-flight requests keep using graph they already got. Blocking, run it off event loop"""
+        logger.info("Reloading RAG graph")
+        with self._lock:
+            importlib.reload(llm_prompts)
+            importlib.reload(agents)
+            return self._build_locked()
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "built_at": self.built_at,
+            "last_build_seconds": self.last_build_seconds,
+        }
+
+
+rag_graph_registry = RAGGraphRegistry()
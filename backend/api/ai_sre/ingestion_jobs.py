@@ -0,0 +1,207 @@
+"""Background knowledge base ingestion jobs, submitted jobs run in background workers with bounded queue"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from datetime import datetime, UTC
+from enum import StrEnum
+
+from api.utils.id_generator import gen_document_id
+from api.utils.logger import logger
+from .schemas import IngestionFileProgress, IngestionJobStatus
+
+DATA_FOLDER = "./data"
+
+
+class JobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class FileStatus(StrEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
+class IngestionJob:
+    """One ingestion job, keep per-file progress and throughput"""
+
+    def __init__(
+        self,
+        collections: list[str],
+        run: Callable[["IngestionJob"], Awaitable[dict]],
+    ):
+        self.job_id = gen_document_id()
+        self.collections = collections
+        self.run = run
+        self.status = JobStatus.QUEUED
+        self.created = datetime.now(UTC)
+        self.started: datetime | None = None
+        self.finished: datetime | None = None
+        self._started_at: float | None = None
+        self._finished_at: float | None = None
+        self.files: dict[str, IngestionFileProgress] = {}
+        self.errors: list[str] = []
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (JobStatus.QUEUED, JobStatus.RUNNING)
+
+    def _file(self, file_url: str) -> IngestionFileProgress:
+        # Same file name may exist in several data folders, progress is keyed by path under data folder,
+        # files outside of it (e.g. code repositories) keep their full path
+        file_name = os.path.relpath(file_url, DATA_FOLDER)
+        if file_name.startswith(os.pardir + os.sep):
+            file_name = os.path.normpath(file_url)
+        if file_name not in self.files:
+            self.files[file_name] = IngestionFileProgress(
+                file_name=file_name, status=FileStatus.PENDING
+            )
+        return self.files[file_name]
+
+    def add_files(self, file_urls: list[str]):
+        for file_url in file_urls:
+            self._file(file_url)
+
+    def set_file_status(
+        self, file_url: str, status: FileStatus, error: str | None = None
+    ):
+        progress = self._file(file_url)
+        progress.status = status
+        if error:
+            progress.error = error
+            self.errors.append(error)
+
+    def add_file_progress(self, file_url: str, pages: int, chunks: int):
+        progress = self._file(file_url)
+        progress.pages += pages
+        progress.chunks += chunks
+
+    def to_status(self) -> IngestionJobStatus:
+        pages = sum(progress.pages for progress in self.files.values())
+        chunks = sum(progress.chunks for progress in self.files.values())
+        pages_per_second = chunks_per_second = None
+        if self._started_at is not None:
+            end = self._finished_at or time.monotonic()
+            elapsed = max(end - self._started_at, 1e-6)
+            pages_per_second = round(pages / elapsed, 2)
+            chunks_per_second = round(chunks / elapsed, 2)
+        return IngestionJobStatus(
+            job_id=self.job_id,
+            status=self.status,
+            collections=self.collections,
+            created=self.created,
+            started=self.started,
+            finished=self.finished,
+            files=list(self.files.values()),
+            pages=pages,
+            chunks=chunks,
+            pages_per_second=pages_per_second,
+            chunks_per_second=chunks_per_second,
+            errors=self.errors,
+        )
+
+
+class IngestionQueueFullError(Exception):
+    """Raised when ingestion job queue is full"""
+
+
+class IngestionJobManager:
+    """Run ingestion jobs in background workers, only one active job per collection is allowed,
+    submitting again while a job is active returns the active job"""
+
+    def __init__(self, workers: int, max_queue_size: int, max_history: int):
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.max_history = max_history
+        self._queue: asyncio.Queue[IngestionJob] | None = None
+        self._worker_tasks: list[asyncio.Task] = []
+        self._jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        self._active_jobs: dict[str, IngestionJob] = {}
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker_tasks = [
+            asyncio.create_task(self._work()) for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(
+        self,
+        collections: list[str],
+        run: Callable[[IngestionJob], Awaitable[dict]],
+    ) -> IngestionJob:
+        if self._queue is None:
+            raise Exception("Ingestion job manager has not started")
+        for collection in collections:
+            active_job = self._active_jobs.get(collection)
+            if active_job is not None and active_job.is_active:
+                logger.info(
+                    f"Ingestion job {active_job.job_id} already active for {collection}"
+                )
+                return active_job
+
+        job = IngestionJob(collections, run)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise IngestionQueueFullError("Too many ingestion jobs in queue")
+        for collection in collections:
+            self._active_jobs[collection] = job
+        self._jobs[job.job_id] = job
+        while len(self._jobs) > self.max_history:
+            oldest_id = next(iter(self._jobs))
+            if self._jobs[oldest_id].is_active:
+                break
+            self._jobs.pop(oldest_id)
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        return self._jobs.get(job_id)
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            job.status = JobStatus.RUNNING
+            job.started = datetime.now(UTC)
+            job._started_at = time.monotonic()
+            logger.info(f"Start ingestion job {job.job_id}")
+            try:
+                result = await job.run(job)
+                if result.get("status") == "Success":
+                    job.status = JobStatus.SUCCEEDED
+                else:
+                    job.status = JobStatus.FAILED
+                    if result.get("error") and not job.errors:
+                        job.errors.append(result["error"])
+            except Exception as e:
+                logger.exception(f"Ingestion job {job.job_id} failed: {e}")
+                job.status = JobStatus.FAILED
+                job.errors.append(str(e))
+            finally:
+                job.finished = datetime.now(UTC)
+                job._finished_at = time.monotonic()
+                for collection in job.collections:
+                    if self._active_jobs.get(collection) is job:
+                        self._active_jobs.pop(collection)
+                self._queue.task_done()
+            logger.info(f"Ingestion job {job.job_id} {job.status}")
+
+
+ingestion_job_manager = IngestionJobManager(
+    workers=int(os.environ.get("INGEST_JOB_WORKERS", "1")),
+    max_queue_size=int(os.environ.get("INGEST_JOB_QUEUE_SIZE", "10")),
+    max_history=int(os.environ.get("INGEST_JOB_HISTORY_SIZE", "100")),
+)
@@ -3,7 +3,19 @@
 from datetime import datetime
 from enum import StrEnum
 
-from sqlalchemy import String, Enum, select, Integer, ForeignKey
+from sqlalchemy import (
+    BigInteger,
+    String,
+    Text,
+    Enum,
+    Index,
+    insert,
+    select,
+    tuple_,
+    Integer,
+    ForeignKey,
+    delete,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import func
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -23,11 +35,13 @@ class Chat(Base):
     """Chats table to save all chats with AI"""
 
     __tablename__ = "chats"
+    # Serves keyset pagination of user chats, (user_id, created) prefix also serves recent chats
+    __table_args__ = (
+        Index("ix_chats_user_id_created_id", "user_id", "created", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
-    user_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("users.id"), index=True
-    )
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
     role_type: Mapped[str] = mapped_column(Enum(RoleTypes), nullable=False)
     content: Mapped[str] = mapped_column(String(2048), nullable=False)
     created: Mapped[datetime] = mapped_column(insert_default=func.now())
@@ -36,20 +50,58 @@ class Chat(Base):
     )
 
     @classmethod
-    async def create(cls, db: AsyncSession, **kwargs):
+    async def create_pairs(
+        cls, db: AsyncSession, pairs: list[tuple[int, str, str]]
+    ) -> list[int]:
+        """Insert (user_id, question, answer) chat pairs in one statement and transaction, ids are
+        returned by INSERT RETURNING instead of refreshing every row"""
+        rows = []
+        for user_id, question, answer in pairs:
+            rows.append(
+                {
+                    "user_id": user_id,
+                    "role_type": RoleTypes.HUMAN,
+                    "content": question,
+                }
+            )
+            rows.append(
+                {
+                    "user_id": user_id,
+                    "role_type": RoleTypes.AI,
+                    "content": answer,
+                }
+            )
         try:
-            new_chat = cls(**kwargs)
-            db.add(new_chat)
+            results = await db.scalars(
+                insert(cls).returning(cls.id, sort_by_parameter_order=True),
+                rows,
+            )
+            chat_ids = list(results.all())
             await db.commit()
-            await db.refresh(new_chat)
-            return new_chat
+            return chat_ids
         except Exception as e:
-            logger.exception(f"Failed to insert chat: {e}")
+            await db.rollback()
+            logger.exception(f"Failed to insert chats: {e}")
             raise e
 
     @classmethod
-    async def find_by_userid(cls, db: AsyncSession, user_id: int):
-        results = await db.scalars(select(cls).where(cls.user_id == user_id))
+    async def find_page_by_userid(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        limit: int,
+        before: tuple[datetime, int] | None = None,
+    ):
+        """Load one page of user chats older than before cursor (created, id), newest first.
+        Only columns shown in chat history are selected"""
+        query = select(cls.id, cls.role_type, cls.content, cls.created).where(
+            cls.user_id == user_id
+        )
+        if before is not None:
+            query = query.where(tuple_(cls.created, cls.id) < before)
+        results = await db.execute(
+            query.order_by(cls.created.desc(), cls.id.desc()).limit(limit)
+        )
         return results.all()
 
     @classmethod
@@ -66,43 +118,87 @@ class Chat(Base):
 
     @classmethod
     async def find_recent_chat_history(
-        cls, db: AsyncSession, user_id: int, limit: int
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        limit: int,
+        after_id: int | None = None,
+    ):
+        """Load recent chats of user newer than after_id in chronological order"""
+        query = select(cls).where(cls.user_id == user_id)
+        if after_id is not None:
+            query = query.where(cls.id > after_id)
+        results = await db.scalars(
+            query.order_by(cls.created.desc(), cls.id.desc()).limit(limit)
+        )
+        return list(reversed(results.all()))
+
+    @classmethod
+    async def find_chats_between(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        after_id: int,
+        before_id: int,
+        limit: int,
     ):
-        query = await db.scalars(
+        """Load oldest chats of user with id between after_id and before_id in chronological
+        order"""
+        results = await db.scalars(
             select(cls)
-            .where(cls.user_id == user_id)
-            .order_by(cls.created.desc())
+            .where(
+                cls.user_id == user_id,
+                cls.id > after_id,
+                cls.id < before_id,
+            )
+            .order_by(cls.id)
             .limit(limit)
         )
-        chat_records = query.all()
-        chat_history = {}
-        if not chat_records:
-            return chat_history
-        # If loaded last record is from AI (means answer only), discard it as we need a pair of chat messages
-        while chat_records[-1].role_type == "ai":
-            chat_records.pop()
-        chat_records.sort(key=lambda x: x.created)
-
-        index = 0
-        while index < len(chat_records):
-            human_message = chat_records[index].content
-            ai_message = ""
-            index += 1
-            if (
-                index < len(chat_records)
-                and chat_records[index].role_type == "ai"
-            ):
-                ai_message = chat_records[index].content
-                index += 1
-            chat_history[human_message] = ai_message
-            # discard answer without question, normally this should not happen
-            while (
-                index < len(chat_records)
-                and chat_records[index].role_type == "ai"
-            ):
-                index += 1
-
-        return chat_history
+        return list(results.all())
+
+
+class ChatSummary(Base):
+    """chat_summaries table to save rolling summary of user chats older than chat memory window"""
+
+    __tablename__ = "chat_summaries"
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id"), unique=True
+    )
+    summary: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    # Chats with id up to this one are included in summary
+    summarized_until_id: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
+    updated: Mapped[datetime] = mapped_column(
+        insert_default=func.now(), onupdate=func.now()
+    )
+
+    @classmethod
+    async def find_by_userid(cls, db: AsyncSession, user_id: int):
+        return await db.scalar(select(cls).where(cls.user_id == user_id))
+
+    @classmethod
+    async def save(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        summary: str,
+        summarized_until_id: int,
+    ):
+        try:
+            record = await cls.find_by_userid(db, user_id)
+            if record is None:
+                record = cls(user_id=user_id)
+                db.add(record)
+            record.summary = summary
+            record.summarized_until_id = summarized_until_id
+            await db.commit()
+            return record
+        except Exception as e:
+            logger.exception(f"Failed to save chat summary: {e}")
+            raise e
 
 
 class IngestedFile(Base):
@@ -113,6 +209,12 @@ class IngestedFile(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     file_name: Mapped[str] = mapped_column(String, nullable=False)
     file_hash: Mapped[str] = mapped_column(String, nullable=False)
+    # Path, size and modification time are used to skip unchanged files without hashing them
+    file_path: Mapped[str | None] = mapped_column(
+        String, nullable=True, index=True
+    )
+    file_size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    file_mtime_ns: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
     created: Mapped[datetime] = mapped_column(insert_default=func.now())
 
     @classmethod
@@ -133,3 +235,43 @@ class IngestedFile(Base):
     async def find_by_file_hash(cls, db: AsyncSession, file_hash: str):
         query = await db.execute(select(cls).where(cls.file_hash == file_hash))
         return query.scalars().all()
+
+    @classmethod
+    async def find_by_file_path(cls, db: AsyncSession, file_path: str):
+        query = await db.execute(
+            select(cls)
+            .where(cls.file_path == file_path)
+            .order_by(cls.created.desc())
+            .limit(1)
+        )
+        return query.scalars().first()
+
+    @classmethod
+    async def find_all(cls, db: AsyncSession):
+        query = await db.execute(select(cls))
+        return query.scalars().all()
+
+    @classmethod
+    async def delete_by_ids(cls, db: AsyncSession, ids: list[int]):
+        try:
+            await db.execute(delete(cls).where(cls.id.in_(ids)))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.exception(
+                f"Failed to delete records in ingested_files table: {e}"
+            )
+            raise e
+
+    async def update(self, db: AsyncSession, **kwargs):
+        try:
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+            await db.commit()
+            await db.refresh(self)
+            return self
+        except Exception as e:
+            logger.exception(
+                f"Failed to update record in ingested_files table: {e}"
+            )
+            raise e
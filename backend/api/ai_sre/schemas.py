@@ -12,5 +12,34 @@ class ChatRecord(BaseModel):
     created: datetime
 
 
+class ChatHistoryPage(BaseModel):
+    chat_history: list[ChatRecord]
+    # Pass as before parameter to load older chats, None if there are no older chats
+    next_cursor: str | None = None
+
+
 class ChatCompletionRequest(BaseModel):
     query: str
+
+
+class IngestionFileProgress(BaseModel):
+    file_name: str
+    status: str
+    pages: int = 0
+    chunks: int = 0
+    error: str | None = None
+
+
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    status: str
+    collections: list[str]
+    created: datetime
+    started: datetime | None = None
+    finished: datetime | None = None
+    files: list[IngestionFileProgress]
+    pages: int
+    chunks: int
+    pages_per_second: float | None = None
+    chunks_per_second: float | None = None
+    errors: list[str]
@@ -1,28 +1,66 @@
 """All services related to chatbot"""
 
 import os
+import json
+import base64
+import asyncio
+import multiprocessing
+from datetime import datetime
+from collections.abc import AsyncIterator, Awaitable, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
 
-from langchain.storage import LocalFileStore
 from sqlalchemy.ext.asyncio import AsyncSession
+from weaviate import WeaviateClient
 
-from api.utils.data_loader import PDFLoader, IncidentDocLoader
+from api.auth.passwords import password_hasher
+from api.auth.user_cache import auth_user_cache
+from api.database.db import session_manager
+from api.utils.data_loader import PDFLoader, IncidentDocLoader, BatchSettings
 from api.utils.logger import logger
-from .agents import (
-    TEXT_COLLECTION_NAME,
-    SUMMARY_COLLECTION_NAME,
-    build_rag_graph,
-)
-from .schemas import ChatRecord
+from api.utils.tracing import span, tracer
+from . import agents
+from .graph_registry import rag_graph_registry
+from .answer_cache import answer_cache
+from .chat_memory import load_chat_memory, schedule_chat_summary_update
+from .chat_writer import chat_writer
+from .schemas import ChatRecord, ChatHistoryPage, IngestionJobStatus
+from .ingestion_jobs import IngestionJob, FileStatus, ingestion_job_manager
 from .models import (
     Chat as ChatModel,
     IngestedFile as IngestedFileModel,
-    RoleTypes,
 )
-from api.utils.hash_file import get_file_hash
-from api.utils.vs_weaviate_utils import get_client
+from api.utils.hash_file import get_file_hash, get_file_stat
+from api.utils.vs_weaviate_utils import (
+    weaviate_manager,
+    get_object_store,
+    INCIDENT_PAGE_COLLECTION_NAME,
+)
+from api.utils.llm_google_utils import embedding_cache
+from api.utils.metrics_store import (
+    MONITORING_DATA_FOLDER,
+    METRICS_STORE_FOLDER,
+    METRIC_RECORD_SUFFIXES,
+    ingest_metric_files,
+    metrics_store,
+)
+from api.utils.code_change_index import CODE_REPOSITORIES, code_change_index
+from api.utils.historical_incident_index import (
+    HISTORICAL_INCIDENTS_FOLDER,
+    INCIDENT_RECORD_SUFFIXES,
+    build_segment,
+    historical_incident_index,
+)
 
 RETRIEVE_CHATS_NUM = 50
+MAX_RETRIEVE_CHATS_NUM = 200
 IMPORT_FILES_FOLDER = "./data"
+INGEST_PARSE_WORKERS = int(
+    os.environ.get("INGEST_PARSE_WORKERS", str(os.cpu_count() or 1))
+)
+INGEST_FILE_CONCURRENCY = int(os.environ.get("INGEST_FILE_CONCURRENCY", "4"))
+INGEST_EMBED_BATCH_SIZE = int(os.environ.get("INGEST_EMBED_BATCH_SIZE", "100"))
+INGEST_EMBED_CONCURRENCY = int(os.environ.get("INGEST_EMBED_CONCURRENCY", "4"))
+INGEST_WRITE_BATCH_SIZE = int(os.environ.get("INGEST_WRITE_BATCH_SIZE", "200"))
 
 
 def find_all_data_files(folder_url: str):
@@ -39,66 +77,396 @@ def find_all_data_files(folder_url: str):
     return technical_files, incident_summary_files
 
 
-async def load_technical_pdf_files(file_urls: list[str], db: AsyncSession):
-    """Load technical PDF files, like runbook, engineering docs"""
-    with get_client() as client:
-        pdf_loader = PDFLoader(client, TEXT_COLLECTION_NAME)
-        error_messages = []
-        for file_url in file_urls:
-            pdf_file_name = file_url.split("/")[-1]
-            pdf_file_hash = get_file_hash(file_url)
-            result = await IngestedFileModel.find_by_file_hash(
-                db=db, file_hash=pdf_file_hash
+async def find_new_files(
+    file_urls: list[str],
+    db: AsyncSession,
+    skip_file: Callable[[str], None],
+) -> list[tuple[str, dict, IngestedFileModel | None]]:
+    """Find new or changed files with their file info and existing record. Unchanged files are
+    detected by path, size and modification time first, only files failed this check are
+    hashed. New paths with content already ingested are skipped"""
+    file_stats = await asyncio.gather(
+        *(asyncio.to_thread(get_file_stat, file_url) for file_url in file_urls)
+    )
+    candidates = []
+    for file_url, (file_size, file_mtime_ns) in zip(file_urls, file_stats):
+        record = await IngestedFileModel.find_by_file_path(
+            db=db, file_path=file_url
+        )
+        if (
+            record
+            and record.file_size == file_size
+            and record.file_mtime_ns == file_mtime_ns
+        ):
+            skip_file(file_url)
+        else:
+            candidates.append((file_url, file_size, file_mtime_ns, record))
+
+    file_hashes = await asyncio.gather(
+        *(
+            asyncio.to_thread(get_file_hash, file_url)
+            for file_url, *_ in candidates
+        )
+    )
+    new_files = []
+    new_file_hashes = set()
+    for (file_url, file_size, file_mtime_ns, record), file_hash in zip(
+        candidates, file_hashes
+    ):
+        file_info = {
+            "file_hash": file_hash,
+            "file_size": file_size,
+            "file_mtime_ns": file_mtime_ns,
+        }
+        if record and record.file_hash == file_hash:
+            # Only touched, keep new modification time to skip hashing next time
+            await record.update(db=db, **file_info)
+            skip_file(file_url)
+        elif record is None and file_hash in new_file_hashes:
+            # Same content as other file of this run, not recorded in case that one fails
+            skip_file(file_url)
+        elif record is None and await IngestedFileModel.find_by_file_hash(
+            db=db, file_hash=file_hash
+        ):
+            # New path of content already ingested, like copied or renamed file. Path is
+            # recorded, so it is skipped without hashing next time
+            await IngestedFileModel.create(
+                db=db,
+                file_name=file_url.rsplit("/", 1)[-1],
+                file_path=file_url,
+                **file_info,
             )
-            if not result:
-                if await pdf_loader.load(file_url):
-                    await IngestedFileModel.create(
-                        db=db, file_name=pdf_file_name, file_hash=pdf_file_hash
-                    )
-                else:
-                    error_messages.append(
-                        f"Failed to load PDF file {pdf_file_name}"
-                    )
+            skip_file(file_url)
+        else:
+            new_file_hashes.add(file_hash)
+            new_files.append((file_url, file_info, record))
+    return new_files
+
+
+async def ingest_files(
+    file_urls: list[str],
+    db: AsyncSession,
+    load_file: Callable[..., Awaitable[bool]],
+    file_type: str,
+    job: IngestionJob | None = None,
+) -> list[str]:
+    """Ingest new or changed files, files are loaded concurrently with bounded concurrency.
+    DB session can't be shared by concurrent tasks, so all DB operations are serialized"""
+    error_messages = []
+    if job:
+        job.add_files(file_urls)
+
+    def skip_file(file_url: str):
+        logger.info(f"Already ingested {file_url}, skip it")
+        if job:
+            job.set_file_status(file_url, FileStatus.SKIPPED)
+
+    new_files = await find_new_files(file_urls, db, skip_file)
+
+    file_semaphore = asyncio.Semaphore(INGEST_FILE_CONCURRENCY)
+    db_lock = asyncio.Lock()
+
+    async def ingest_file(
+        file_url: str, file_info: dict, record: IngestedFileModel | None
+    ):
+        file_name = file_url.rsplit("/", 1)[-1]
+        on_progress = None
+        if job:
+            job.set_file_status(file_url, FileStatus.RUNNING)
+
+            def on_progress(pages: int, chunks: int):
+                job.add_file_progress(file_url, pages, chunks)
+
+        async with file_semaphore:
+            loaded = await load_file(file_url, on_progress=on_progress)
+        if not loaded:
+            error_message = f"Failed to load {file_type} file {file_name}"
+            error_messages.append(error_message)
+            if job:
+                job.set_file_status(file_url, FileStatus.FAILED, error_message)
+            return
+        async with db_lock:
+            if record:
+                await record.update(db=db, **file_info)
             else:
-                logger.info(f"Already ingested {file_url}, skip it")
+                await IngestedFileModel.create(
+                    db=db, file_name=file_name, file_path=file_url, **file_info
+                )
+        if job:
+            job.set_file_status(file_url, FileStatus.DONE)
+        # Cached answers may miss knowledge from new document
+        answer_cache.invalidate()
 
-        return error_messages
+    await asyncio.gather(
+        *(
+            ingest_file(file_url, file_info, record)
+            for file_url, file_info, record in new_files
+        )
+    )
+    return error_messages
+
+
+async def load_technical_pdf_files(
+    file_urls: list[str],
+    db: AsyncSession,
+    client: WeaviateClient,
+    executor: Executor | None = None,
+    job: IngestionJob | None = None,
+):
+    """Load technical PDF files, like runbook, engineering docs"""
+    pdf_loader = PDFLoader(
+        client,
+        agents.TEXT_COLLECTION_NAME,
+        executor=executor,
+        batch_settings=BatchSettings(
+            embed_batch_size=INGEST_EMBED_BATCH_SIZE,
+            embed_concurrency=INGEST_EMBED_CONCURRENCY,
+            write_batch_size=INGEST_WRITE_BATCH_SIZE,
+        ),
+    )
+    return await ingest_files(file_urls, db, pdf_loader.load, "PDF", job)
 
 
-async def load_incident_docs(files: list[str], db: AsyncSession) -> list[str]:
+async def load_incident_docs(
+    files: list[str],
+    db: AsyncSession,
+    client: WeaviateClient,
+    executor: Executor | None = None,
+    job: IngestionJob | None = None,
+) -> list[str]:
     """Load incident summary document files for later multi-vector retriever, file format is PDF with texts and charts"""
-    error_messages = []
+    incident_doc_loader = IncidentDocLoader(
+        object_store=get_object_store(),
+        client=client,
+        summary_collection_name=agents.SUMMARY_COLLECTION_NAME,
+        page_collection_name=INCIDENT_PAGE_COLLECTION_NAME,
+        executor=executor,
+    )
+    if await asyncio.to_thread(incident_doc_loader.remove_legacy_documents):
+        answer_cache.invalidate()
     if not files:
-        return error_messages
-
-    store = LocalFileStore(IMPORT_FILES_FOLDER)
-    with get_client() as client:
-        incident_doc_loader = IncidentDocLoader(
-            object_store=store,
-            client=client,
-            summary_collection_name=SUMMARY_COLLECTION_NAME,
+        return []
+
+    return await ingest_files(
+        files, db, incident_doc_loader.load, "incident analysis", job
+    )
+
+
+async def remove_deleted_files(
+    file_urls: list[str], db: AsyncSession, client: WeaviateClient
+) -> list[str]:
+    """Remove indexed content and records of ingested files which no longer exist.
+    Records without path were written before paths were recorded, they are removed too and
+    their files loaded again. Other paths with content of removed file were skipped as already
+    ingested, their records are removed so they are loaded under their own path"""
+    existing_files = set(file_urls)
+    records = await IngestedFileModel.find_all(db)
+    removed_records = [
+        record
+        for record in records
+        if record.file_path is None or record.file_path not in existing_files
+    ]
+    if not removed_records:
+        return []
+
+    pdf_loader = PDFLoader(client, agents.TEXT_COLLECTION_NAME)
+    incident_doc_loader = IncidentDocLoader(
+        object_store=get_object_store(),
+        client=client,
+        summary_collection_name=agents.SUMMARY_COLLECTION_NAME,
+        page_collection_name=INCIDENT_PAGE_COLLECTION_NAME,
+    )
+
+    def remove_file_content(file_url: str):
+        pdf_loader.delete_removed_chunks(file_url, [])
+        doc_ids = incident_doc_loader.find_document_ids(file_url)
+        if doc_ids:
+            incident_doc_loader.remove_documents(list(doc_ids))
+
+    error_messages = []
+    removed_hashes = set()
+    failed_ids = set()
+    for record in removed_records:
+        # Technical PDF files were loaded from top of data folder before paths were recorded
+        file_url = (
+            record.file_path or f"{IMPORT_FILES_FOLDER}/{record.file_name}"
         )
-        for file_url in files:
-            file_name = file_url.split("/")[-1]
-            file_hash = get_file_hash(file_url)
-            result = await IngestedFileModel.find_by_file_hash(
-                db=db, file_hash=file_hash
+        if file_url in existing_files:
+            continue
+        try:
+            await asyncio.to_thread(remove_file_content, file_url)
+            logger.info(f"Removed content of deleted file {file_url}")
+        except Exception as e:
+            error_messages.append(f"Failed to remove deleted file {file_url}")
+            logger.exception(
+                f"Failed to remove content of deleted file {file_url}: {e}"
             )
-            if not result:
-                if incident_doc_loader.load(file_url):
-                    await IngestedFileModel.create(
-                        db=db, file_name=file_name, file_hash=file_hash
-                    )
-                else:
-                    error_messages.append(
-                        f"Failed to load incident analysis file {file_name}"
-                    )
-            else:
-                logger.info(f"Already ingested {file_name}, skip it")
-        return error_messages
+            # Keep record, so removal is retried next time
+            failed_ids.add(record.id)
+            continue
+        removed_hashes.add(record.file_hash)
+
+    removed_ids = {record.id for record in removed_records} | {
+        record.id for record in records if record.file_hash in removed_hashes
+    }
+    removed_ids -= failed_ids
+    await IngestedFileModel.delete_by_ids(db, list(removed_ids))
+    answer_cache.invalidate()
+    return error_messages
+
+
+async def find_changed_exports(
+    folder: str,
+    suffixes: tuple[str, ...],
+    changed_sources: Callable[[list[str]], list[str]],
+    job: IngestionJob | None = None,
+) -> list[str]:
+    """List exported files in folder and return new or changed ones, unchanged files are skipped"""
+    if not os.path.isdir(folder):
+        return []
+    files = [
+        f"{folder}/{file}"
+        for file in sorted(os.listdir(folder))
+        if file.endswith(suffixes)
+    ]
+    if job:
+        job.add_files(files)
+    changed_files = await asyncio.to_thread(changed_sources, files)
+    for file_url in files:
+        if file_url not in changed_files:
+            logger.info(f"Already ingested {file_url}, skip it")
+            if job:
+                job.set_file_status(file_url, FileStatus.SKIPPED)
+    return changed_files
+
+
+async def load_historical_incidents(
+    executor: Executor | None = None, job: IngestionJob | None = None
+) -> list[str]:
+    """Index exported historical incident records, only new or changed export files are indexed"""
+    removed_files = await asyncio.to_thread(
+        historical_incident_index.remove_missing_sources
+    )
+    if removed_files:
+        logger.info(
+            f"Removed incident records of deleted files {removed_files}"
+        )
+        answer_cache.invalidate()
+    changed_files = await find_changed_exports(
+        HISTORICAL_INCIDENTS_FOLDER,
+        INCIDENT_RECORD_SUFFIXES,
+        historical_incident_index.changed_sources,
+        job,
+    )
+
+    error_messages = []
+    loop = asyncio.get_running_loop()
+
+    async def index_file(file_url: str):
+        if job:
+            job.set_file_status(file_url, FileStatus.RUNNING)
+        segment_folder = historical_incident_index.new_segment_folder()
+        try:
+            records = await loop.run_in_executor(
+                executor, build_segment, file_url, segment_folder
+            )
+            await asyncio.to_thread(
+                historical_incident_index.add_segment,
+                file_url,
+                segment_folder,
+                records,
+            )
+        except Exception as e:
+            logger.exception(
+                f"Failed to index incident records {file_url}: {e}"
+            )
+            file_name = file_url.rsplit("/", 1)[-1]
+            error_message = f"Failed to index incident records {file_name}"
+            error_messages.append(error_message)
+            if job:
+                job.set_file_status(file_url, FileStatus.FAILED, error_message)
+            return
+        logger.info(f"Indexed {records} incident records from {file_url}")
+        if job:
+            job.add_file_progress(file_url, 0, records)
+            job.set_file_status(file_url, FileStatus.DONE)
+        answer_cache.invalidate()
+
+    await asyncio.gather(*(index_file(file_url) for file_url in changed_files))
+    return error_messages
 
 
-async def gen_knowledgebase(db: AsyncSession):
+async def load_monitoring_data(
+    executor: Executor | None = None, job: IngestionJob | None = None
+) -> list[str]:
+    """Ingest exported monitoring data into metrics store, only new or changed export files are ingested"""
+    changed_files = await find_changed_exports(
+        MONITORING_DATA_FOLDER,
+        METRIC_RECORD_SUFFIXES,
+        metrics_store.changed_sources,
+        job,
+    )
+    if not changed_files:
+        return []
+
+    if job:
+        for file_url in changed_files:
+            job.set_file_status(file_url, FileStatus.RUNNING)
+    # Files may have points of same metrics, so they are merged in one worker call
+    loop = asyncio.get_running_loop()
+    try:
+        points = await loop.run_in_executor(
+            executor, ingest_metric_files, METRICS_STORE_FOLDER, changed_files
+        )
+    except Exception as e:
+        logger.exception(f"Failed to ingest monitoring data: {e}")
+        error_message = "Failed to ingest monitoring data"
+        if job:
+            for file_url in changed_files:
+                job.set_file_status(file_url, FileStatus.FAILED, error_message)
+        return [error_message]
+    await asyncio.to_thread(metrics_store.reload)
+    logger.info(f"Ingested {points} monitoring data points")
+    if job:
+        for file_url in changed_files:
+            job.set_file_status(file_url, FileStatus.DONE)
+    answer_cache.invalidate()
+    return []
+
+
+async def load_code_changes(job: IngestionJob | None = None) -> list[str]:
+    """Index code change history of configured git repositories since last indexed commits"""
+    if job:
+        job.add_files(CODE_REPOSITORIES)
+    error_messages = []
+    for repo in CODE_REPOSITORIES:
+        if job:
+            job.set_file_status(repo, FileStatus.RUNNING)
+        try:
+            commits = await asyncio.to_thread(
+                code_change_index.update_repository, repo
+            )
+        except Exception as e:
+            logger.exception(f"Failed to index code changes of {repo}: {e}")
+            error_message = f"Failed to index code changes of {repo}"
+            error_messages.append(error_message)
+            if job:
+                job.set_file_status(repo, FileStatus.FAILED, error_message)
+            continue
+        logger.info(f"Indexed {commits} new commits of {repo}")
+        if job:
+            job.add_file_progress(repo, 0, commits)
+            job.set_file_status(
+                repo, FileStatus.DONE if commits else FileStatus.SKIPPED
+            )
+        if commits:
+            answer_cache.invalidate()
+    return error_messages
+
+
+async def gen_knowledgebase(
+    db: AsyncSession, client: WeaviateClient, job: IngestionJob | None = None
+):
     """Ingest all raw data files, indexing and save them into DB or vector DB"""
     error_messages = []
     technical_files, incident_summary_files = find_all_data_files(
@@ -106,16 +474,48 @@ async def gen_knowledgebase(db: AsyncSession):
     )
 
     try:
-        loading_technical_files_errors = await load_technical_pdf_files(
-            file_urls=technical_files, db=db
-        )
-        if loading_technical_files_errors:
-            error_messages.extend(loading_technical_files_errors)
-        loading_incident_summaries_errors = await load_incident_docs(
-            files=incident_summary_files, db=db
+        error_messages.extend(
+            await remove_deleted_files(
+                technical_files + incident_summary_files, db, client
+            )
         )
-        if loading_incident_summaries_errors:
-            error_messages.extend(loading_incident_summaries_errors)
+        # Parsing and rasterizing PDF are CPU bound, run them in worker processes.
+        # Use spawn as forked workers would inherit gRPC and DB connections
+        with ProcessPoolExecutor(
+            max_workers=INGEST_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            loading_technical_files_errors = await load_technical_pdf_files(
+                file_urls=technical_files,
+                db=db,
+                client=client,
+                executor=executor,
+                job=job,
+            )
+            if loading_technical_files_errors:
+                error_messages.extend(loading_technical_files_errors)
+            loading_incident_summaries_errors = await load_incident_docs(
+                files=incident_summary_files,
+                db=db,
+                client=client,
+                executor=executor,
+                job=job,
+            )
+            if loading_incident_summaries_errors:
+                error_messages.extend(loading_incident_summaries_errors)
+            indexing_historical_incidents_errors = (
+                await load_historical_incidents(executor=executor, job=job)
+            )
+            if indexing_historical_incidents_errors:
+                error_messages.extend(indexing_historical_incidents_errors)
+            loading_monitoring_data_errors = await load_monitoring_data(
+                executor=executor, job=job
+            )
+            if loading_monitoring_data_errors:
+                error_messages.extend(loading_monitoring_data_errors)
+        indexing_code_changes_errors = await load_code_changes(job=job)
+        if indexing_code_changes_errors:
+            error_messages.extend(indexing_code_changes_errors)
     except Exception as e:
         logger.error(f"Something wrong when ingesting files: {str(e)}")
         return {"status": "Failed", "error": str(e)}
@@ -125,23 +525,205 @@ async def gen_knowledgebase(db: AsyncSession):
     return {"status": "Success", "error": None}
 
 
-async def gen_ai_completion(db: AsyncSession, user_id: int, query: str) -> str:
-    """Use RAG with agents to generate AI completion for given question"""
-    graph = build_rag_graph()
+async def run_knowledgebase_job(job: IngestionJob) -> dict:
+    """Run knowledge base ingestion in background job with its own DB session"""
+    client = await asyncio.to_thread(weaviate_manager.get_client)
+    async with session_manager.session() as db:
+        return await gen_knowledgebase(db, client, job)
 
-    await ChatModel.create(
-        db=db, user_id=user_id, role_type=RoleTypes.HUMAN, content=query
-    )
-    response = graph.invoke({"query": query, "chat_history": []})
-    completion = response["inter_steps"][-1].log
-    await ChatModel.create(
-        db=db, user_id=user_id, role_type=RoleTypes.AI, content=completion
+
+def submit_knowledgebase_job() -> IngestionJobStatus:
+    """Submit knowledge base ingestion job, return active job if one is already queued or running"""
+    job = ingestion_job_manager.submit(
+        collections=[
+            agents.TEXT_COLLECTION_NAME,
+            agents.SUMMARY_COLLECTION_NAME,
+            INCIDENT_PAGE_COLLECTION_NAME,
+        ],
+        run=run_knowledgebase_job,
     )
+    return job.to_status()
+
+
+def get_knowledgebase_job(job_id: str) -> IngestionJobStatus | None:
+    job = ingestion_job_manager.get(job_id)
+    return job.to_status() if job else None
+
+
+async def gen_ai_completion(db: AsyncSession, user_id: int, query: str) -> str:
+    """Use RAG with agents to generate AI completion for given question, with bounded memory of
+    earlier conversation"""
+    graph = rag_graph_registry.get()
+
+    with span("chat_completion", user_id=user_id):
+        memory = await load_chat_memory(db, user_id)
+        # Answer of follow-up question depends on conversation, only cache standalone questions
+        use_answer_cache = not memory.messages
+        cache_generation = answer_cache.generation
+        completion = (
+            await answer_cache.lookup(query) if use_answer_cache else None
+        )
+        if completion is None:
+            response = await graph.ainvoke(
+                {"query": query, "chat_history": memory.messages}
+            )
+            completion = response["inter_steps"][-1].log
+            if use_answer_cache and completion != agents.NO_ANSWER_MESSAGE:
+                await answer_cache.store(query, completion, cache_generation)
+        await chat_writer.save_pair(user_id, query, completion, db=db)
+        schedule_chat_summary_update(user_id, memory)
 
     return completion
 
 
-async def get_chat_history(db: AsyncSession, user_id: int) -> list[ChatRecord]:
-    """Load chat history for given user"""
-    chat_history = await ChatModel.find_by_userid(db, user_id)
-    return chat_history
+def format_sse(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def graph_event_to_sse(event: dict) -> tuple[list[str], str | None]:
+    """Server-sent events of one graph event: token of final answer being generated or tool node
+    finished. Completion is returned too once final answer node finished"""
+    node = event.get("metadata", {}).get("langgraph_node")
+    if event["event"] == "on_chat_model_stream" and node == "final_answer":
+        content = event["data"]["chunk"].content
+        if content:
+            return [format_sse("token", {"content": content})], None
+        return [], None
+    if not (
+        event["event"] == "on_chain_end"
+        and event["name"] == node
+        and node in agents.TOOL_NODE_NAMES
+    ):
+        return [], None
+    output = event["data"].get("output")
+    if not isinstance(output, dict):
+        return [], None
+    sse_events = []
+    completion = None
+    for action in output.get("inter_steps", []):
+        if node == "final_answer":
+            completion = action.log
+        else:
+            sse_events.append(
+                format_sse("tool", {"tool": action.tool, "status": "done"})
+            )
+    return sse_events, completion
+
+
+async def stream_ai_completion(user_id: int, query: str) -> AsyncIterator[str]:
+    """Stream AI completion events, traced as one request"""
+    with span("chat_completion_stream", user_id=user_id):
+        async for event in _stream_ai_completion(user_id, query):
+            yield event
+
+
+async def _stream_ai_completion(user_id: int, query: str) -> AsyncIterator[str]:
+    """Stream graph progress as server-sent events: one tool event when each tool node finished,
+    token events while final answer generated, then done event with whole completion once chats
+    are saved into DB"""
+    async with session_manager.session() as db:
+        memory = await load_chat_memory(db, user_id)
+    use_answer_cache = not memory.messages
+    cache_generation = answer_cache.generation
+    completion = await answer_cache.lookup(query) if use_answer_cache else None
+    if completion is not None:
+        yield format_sse("token", {"content": completion})
+    else:
+        graph = rag_graph_registry.get()
+        try:
+            async for event in graph.astream_events(
+                {"query": query, "chat_history": memory.messages}, version="v2"
+            ):
+                sse_events, final_answer = graph_event_to_sse(event)
+                for sse_event in sse_events:
+                    yield sse_event
+                if final_answer is not None:
+                    completion = final_answer
+        except Exception as e:
+            logger.exception(f"Failed to stream AI completion: {e}")
+            yield format_sse("error", {"error": "Failed to generate answer"})
+            return
+
+        if completion is None:
+            completion = agents.NO_ANSWER_MESSAGE
+        if use_answer_cache and completion != agents.NO_ANSWER_MESSAGE:
+            await answer_cache.store(query, completion, cache_generation)
+
+    # Request scoped DB session may already be closed when streaming, writer uses own session.
+    # Save chats before done event, client may disconnect right after receiving it
+    await chat_writer.save_pair(user_id, query, completion)
+    schedule_chat_summary_update(user_id, memory)
+    yield format_sse("done", {"chat_completion": completion})
+
+
+def encode_chat_cursor(chat: ChatRecord) -> str:
+    cursor = json.dumps([chat.created.isoformat(), chat.id])
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_chat_cursor(cursor: str) -> tuple[datetime, int]:
+    """Decode cursor returned by chat history, raise ValueError if cursor is invalid"""
+    try:
+        created, chat_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(created), int(chat_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid chat history cursor {cursor}") from e
+
+
+async def get_chat_history(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = RETRIEVE_CHATS_NUM,
+    before: str | None = None,
+) -> ChatHistoryPage:
+    """Load one page of chat history for given user, chats older than before cursor if set.
+    Chats in page are in chronological order"""
+    rows = await ChatModel.find_page_by_userid(
+        db,
+        user_id,
+        limit=limit + 1,
+        before=decode_chat_cursor(before) if before else None,
+    )
+    chats = [
+        ChatRecord.model_validate(row, from_attributes=True) for row in rows
+    ]
+    next_cursor = None
+    if len(chats) > limit:
+        chats = chats[:limit]
+        next_cursor = encode_chat_cursor(chats[-1])
+    chats.reverse()
+    return ChatHistoryPage(chat_history=chats, next_cursor=next_cursor)
+
+
+async def reload_rag_graph() -> dict:
+    """Rebuild compiled RAG graph, used after prompts or tools changed. Reloading modules and
+    compiling graph block, so they run in worker thread"""
+    await asyncio.to_thread(rag_graph_registry.reload)
+    return rag_graph_registry.stats()
+
+
+def get_service_metrics() -> dict:
+    """Collect runtime metrics of chatbot services"""
+    return {
+        "rag_graph": rag_graph_registry.stats(),
+        "weaviate": weaviate_manager.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "chat_writer": chat_writer.stats(),
+        "tracing": tracer.stats(),
+        "db_pool": session_manager.pool_stats(),
+        "auth_user_cache": auth_user_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "historical_incident_index": historical_incident_index.stats(),
+        "code_change_index": code_change_index.stats(),
+        "metrics_store": metrics_store.stats(),
+    }
+
+
+def get_trace_stats() -> dict:
+    """Latency percentiles of request stages and span trees of latest requests"""
+    return {
+        "stages": tracer.stage_stats(),
+        "recent_traces": tracer.recent_traces(),
+    }
@@ -3,10 +3,10 @@ import jwt
 from datetime import datetime, timedelta, UTC
 
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 
+from api.auth.passwords import password_hasher
 from api.user.schemas import User
 from api.user import services as user_services
 
@@ -15,11 +15,8 @@ ACCESS_TOKEN_ALGORITHM = "HS256"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
-pw_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pw_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
 async def authenticate_user(
@@ -29,7 +26,7 @@ async def authenticate_user(
     error_msg = "Incorrect username or password"
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=error_msg)
-    if not verify_password(password, user.password):
+    if not await verify_password(password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=error_msg)
 
     return user
@@ -0,0 +1,80 @@
+"""Cache of verified access tokens and their users, authenticated requests skip JWT decoding and
+user lookup while cached. Cache is per process, entries live at most TTL seconds and never beyond
+token expiry, so changes made by other workers are picked up after TTL"""
+
+import os
+import time
+from collections import OrderedDict
+
+from api.user.schemas import User
+
+AUTH_CACHE_ENABLED = (
+    os.environ.get("AUTH_CACHE_ENABLED", "true").lower() == "true"
+)
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+
+class AuthUserCache:
+    """LRU map of access token to (user, expires_at), bounded by max entries"""
+
+    def __init__(self, enabled: bool, ttl_seconds: float, max_entries: int):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[User, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> User | None:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def set(self, token: str, user: User, token_expires_at: float | None):
+        """Cache user of verified token, entry expires with token if it expires before TTL"""
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        self._entries[token] = (user, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_user(self, username: str):
+        """Drop cached tokens of user, called whenever user is changed"""
+        for token in [
+            token
+            for token, (user, _) in self._entries.items()
+            if user.username == username
+        ]:
+            del self._entries[token]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+auth_user_cache = AuthUserCache(
+    AUTH_CACHE_ENABLED, AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAX_ENTRIES
+)
@@ -1,9 +1,13 @@
 """Set up DB config and instance, including sync and async ones"""
 
 import os
+import time
 import contextlib
 from collections.abc import AsyncIterator
+from contextvars import ContextVar
 
+from sqlalchemy import exc, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_sessionmaker,
@@ -18,6 +22,32 @@ load_dotenv()
 
 CHATBOT_DB_ASYNC_URL = os.environ.get("CHATBOT_DB_ASYNC_URL")
 RETRIEVAL_DB_SYNC_URL = os.environ.get("RETRIEVAL_DB_SYNC_URL")
+DB_ECHO = os.environ.get("DB_ECHO", "false").lower() == "true"
+# Connections per worker process, size pool against uvicorn worker count and DB max_connections
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+# Extra connections opened beyond pool size under load, -1 for unlimited
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.environ.get("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.environ.get("DB_POOL_RECYCLE_SECONDS", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+# Compiled SQL cache of SQLAlchemy, and prepared statement cache of each asyncpg connection
+DB_QUERY_CACHE_SIZE = int(os.environ.get("DB_QUERY_CACHE_SIZE", "500"))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(
+    os.environ.get("DB_PREPARED_STATEMENT_CACHE_SIZE", "100")
+)
+# Checkouts waiting longer than this are counted as slow
+DB_SLOW_CHECKOUT_SECONDS = 0.1
+# create_all only creates missing tables, columns and indexes added to existing tables later
+# are added here. Statements run on every startup, so they must be idempotent
+SCHEMA_UPGRADES = [
+    "ALTER TABLE ingested_files ADD COLUMN IF NOT EXISTS file_path VARCHAR",
+    "ALTER TABLE ingested_files ADD COLUMN IF NOT EXISTS file_size BIGINT",
+    "ALTER TABLE ingested_files ADD COLUMN IF NOT EXISTS file_mtime_ns BIGINT",
+    "CREATE INDEX IF NOT EXISTS ix_ingested_files_file_path "
+    "ON ingested_files (file_path)",
+    "CREATE INDEX IF NOT EXISTS ix_chats_user_id_created_id "
+    "ON chats (user_id, created, id)",
+]
 
 
 class Base(DeclarativeBase):
@@ -27,6 +57,104 @@ class Base(DeclarativeBase):
     __mapper_args__ = {"eager_defaults": True}
 
 
+# Seconds spent creating connections during current checkout, None outside of checkout. Set
+# by outermost _do_get only, QueuePool retries by calling _do_get again
+_checkout_connect_seconds: ContextVar[list[float] | None] = ContextVar(
+    "checkout_connect_seconds", default=None
+)
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """Connection pool which records how long checkouts wait for free connection, time spent
+    creating new connections is recorded separately"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+        self.connects = 0
+        self.connect_total = 0.0
+        self.connect_max = 0.0
+
+    def _do_get(self):
+        if _checkout_connect_seconds.get() is not None:
+            # Retry within checkout, counted by outer call
+            return super()._do_get()
+        connect_seconds = [0.0]
+        token = _checkout_connect_seconds.set(connect_seconds)
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            wait = time.perf_counter() - started - connect_seconds[0]
+            _checkout_connect_seconds.reset(token)
+            self.checkouts += 1
+            self.checkout_wait_total += wait
+            self.checkout_wait_max = max(self.checkout_wait_max, wait)
+            if wait > DB_SLOW_CHECKOUT_SECONDS:
+                self.slow_checkouts += 1
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            seconds = time.perf_counter() - started
+            self.connects += 1
+            self.connect_total += seconds
+            self.connect_max = max(self.connect_max, seconds)
+            connect_seconds = _checkout_connect_seconds.get()
+            if connect_seconds is not None:
+                connect_seconds[0] += seconds
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "idle": self.checkedin(),
+            # Negative max_overflow means no overflow limit
+            "capacity": self.size() + self._max_overflow
+            if self._max_overflow >= 0
+            else None,
+            "checkouts": self.checkouts,
+            "slow_checkouts": self.slow_checkouts,
+            "checkout_timeouts": self.checkout_timeouts,
+            "checkout_wait_avg_ms": self.checkout_wait_total
+            / max(self.checkouts, 1)
+            * 1000,
+            "checkout_wait_max_ms": self.checkout_wait_max * 1000,
+            "connects": self.connects,
+            "connect_avg_ms": self.connect_total / max(self.connects, 1) * 1000,
+            "connect_max_ms": self.connect_max * 1000,
+        }
+
+
+def get_engine_kwargs(url: str) -> dict:
+    """Engine settings from environment"""
+    engine_kwargs = {
+        "echo": DB_ECHO,
+        "poolclass": MeteredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "query_cache_size": DB_QUERY_CACHE_SIZE,
+    }
+    if url.startswith("postgresql+asyncpg"):
+        engine_kwargs["connect_args"] = {
+            "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE
+        }
+    return engine_kwargs
+
+
 class DBSessionManager:
     """DB session manager to manage all async session with DB"""
 
@@ -62,6 +190,13 @@ class DBSessionManager:
                 await session.rollback()
                 raise
 
+    def pool_stats(self) -> dict:
+        if self.engine is None or not isinstance(
+            self.engine.pool, MeteredQueuePool
+        ):
+            return {}
+        return self.engine.pool.stats()
+
     async def close(self):
         if self.engine is None:
             raise Exception("Database session manager has not initialized")
@@ -71,8 +206,10 @@ class DBSessionManager:
         self._sessionmaker = None
 
 
-chatbot_db_async_engine = create_async_engine(CHATBOT_DB_ASYNC_URL, echo=True)
-session_manager = DBSessionManager(CHATBOT_DB_ASYNC_URL, {"echo": True})
+# Single engine and connection pool shared by whole app
+session_manager = DBSessionManager(
+    CHATBOT_DB_ASYNC_URL, get_engine_kwargs(CHATBOT_DB_ASYNC_URL)
+)
 
 
 async def get_db():
@@ -83,6 +220,9 @@ async def get_db():
 
 # Used during initialize backend (server.py), to create all missing tables with registered DB models
 async def create_all_tables():
-    """Create all tables based on schema"""
-    async with chatbot_db_async_engine.begin() as connection:
+    """Create all tables based on schema, then add columns and indexes missing in existing
+    tables"""
+    async with session_manager.connect() as connection:
         await connection.run_sync(Base.metadata.create_all)
+        for statement in SCHEMA_UPGRADES:
+            await connection.execute(text(statement))
@@ -4,14 +4,22 @@ from jwt.exceptions import InvalidTokenError
 from fastapi import Depends, HTTPException, status
 
 from api.auth.services import oauth2_scheme, decode_jwt
-from .db import DBSessionDep
+from api.auth.user_cache import auth_user_cache
+from api.database.db import session_manager
 from api.user.schemas import User
+from api.user.models import Roles
 from api.user.services import get_by_name
 
 
 async def get_current_user_from_token(
-        token: Annotated[str, Depends(oauth2_scheme)], db: DBSessionDep
+        token: Annotated[str, Depends(oauth2_scheme)]
 ) -> User:
+    """Resolve user of access token. FastAPI resolves it once per request even if several
+    dependencies use it, cached tokens need no DB session at all"""
+    user = auth_user_cache.get(token)
+    if user:
+        return user
+
     auth_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="You are not authenticated",
@@ -24,10 +32,13 @@ async def get_current_user_from_token(
             raise auth_exception
     except InvalidTokenError:
         raise auth_exception
-    user = await get_by_name(db, username)
+    async with session_manager.session() as db:
+        user = await get_by_name(db, username)
     if not user:
         raise auth_exception
 
+    user = User.model_validate(user)
+    auth_user_cache.set(token, user, payload.get("exp"))
     return user
 
 
@@ -37,3 +48,13 @@ CurrentUserDep = Annotated[User, Depends(get_current_user_from_token)]
 async def valid_is_authenticated(current_user: CurrentUserDep) -> User:
     """Auth dependency with access token validation"""
     return current_user
+
+
+async def valid_is_admin(current_user: CurrentUserDep) -> User:
+    """Auth dependency which only allows admin users"""
+    if current_user.role != Roles.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin permission required",
+        )
+    return current_user
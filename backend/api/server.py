@@ -11,6 +11,12 @@ from api.user.services import create_user, get_all_users
 from api.user.schemas import UserForm
 from api.user.models import Roles
 from api.ai_sre.ai_sre_router import ai_sre_router
+from api.ai_sre.graph_registry import rag_graph_registry
+from api.ai_sre.ingestion_jobs import ingestion_job_manager
+from api.ai_sre.chat_writer import chat_writer
+from api.auth.passwords import password_hasher
+from api.utils.tracing import tracer
+from api.utils.vs_weaviate_utils import weaviate_manager
 
 load_dotenv()
 
@@ -27,7 +33,18 @@ async def lifespan(app: FastAPI):
                 session,
                 UserForm(username="admin", password="54321", role=Roles.ADMIN),
             )
+    # One long-lived Weaviate client shared by all requests and tools
+    weaviate_manager.connect()
+    # Compile RAG graph once, all chat requests share it
+    rag_graph_registry.build()
+    ingestion_job_manager.start()
+    chat_writer.start()
     yield
+    await chat_writer.stop()
+    await ingestion_job_manager.stop()
+    weaviate_manager.close()
+    password_hasher.shutdown()
+    tracer.shutdown()
     if session_manager.engine is not None:
         await session_manager.close()
 
@@ -1,17 +1,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import NoResultFound
 from fastapi import HTTPException
-from passlib.context import CryptContext
 
+from api.auth.passwords import password_hasher
+from api.auth.user_cache import auth_user_cache
 from .schemas import User, UserForm
 from .models import User as UserModel
 
 
-pw_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
-def hash_password(password: str) -> str:
-    return pw_context.hash(password)
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
 
 
 async def get_all_users(db: AsyncSession) -> list[User]:
@@ -38,7 +36,7 @@ async def get_by_id(db: AsyncSession, id: int) -> User:
 
 
 async def create_user(db: AsyncSession, user_input: UserForm) -> User:
-    hashed_password = hash_password(user_input.password)
+    hashed_password = await hash_password(user_input.password)
     user_input.__dict__.update({"password": hashed_password})
     try:
         user = await UserModel.create(db, **user_input.model_dump())
@@ -47,4 +45,5 @@ async def create_user(db: AsyncSession, user_input: UserForm) -> User:
             status_code=500,
             detail=f"Failed to create user {user_input.username}",
         )
+    auth_user_cache.invalidate_user(user.username)
     return user
@@ -0,0 +1,393 @@
+"""Local index of code change history built from git repositories, answers what changed in which
+paths around given time without running git per query. Commits are indexed incrementally since
+last indexed commit, every run adds one segment of memory-mapped NumPy arrays sorted by commit time,
+with touched paths stored as sorted path list and path to commit postings for prefix queries"""
+
+import bisect
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import uuid
+from collections.abc import Sequence
+
+import numpy as np
+
+from api.utils.historical_incident_index import tokenize
+
+CODE_REPOSITORIES = [
+    repo.strip()
+    for repo in os.environ.get("CODE_REPOSITORIES", "").split(",")
+    if repo.strip()
+]
+CODE_CHANGE_INDEX_FOLDER = os.environ.get(
+    "CODE_CHANGE_INDEX_FOLDER", "./data/index/code_changes"
+)
+# Only latest commits matching filters are ranked by query keywords
+RANK_CANDIDATES_LIMIT = 2000
+
+RECORD_SEPARATOR = "\x1e"
+FIELD_SEPARATOR = "\x1f"
+GIT_LOG_FORMAT = f"{RECORD_SEPARATOR}%H{FIELD_SEPARATOR}%an{FIELD_SEPARATOR}%ae{FIELD_SEPARATOR}%ct{FIELD_SEPARATOR}%s"
+# Renamed paths in numstat look like "src/{old => new}/file.py" or "old.py => new.py"
+RENAME_BRACES = re.compile(r"\{[^{}]* => ([^{}]*)\}")
+
+
+def renamed_path(path: str) -> str:
+    path = RENAME_BRACES.sub(r"\1", path)
+    if " => " in path:
+        path = path.split(" => ")[-1]
+    return path.replace("//", "/")
+
+
+def run_git(repo: str, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-C", repo, *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def read_commits(repo: str, since_commit: str | None):
+    """Read commits with their touched paths and diff stats from git log, since given commit if set"""
+    revision = f"{since_commit}..HEAD" if since_commit else "HEAD"
+    process = subprocess.Popen(
+        [
+            "git",
+            "-C",
+            repo,
+            "log",
+            "--no-merges",
+            "--numstat",
+            f"--format={GIT_LOG_FORMAT}",
+            revision,
+        ],
+        stdout=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    commit = None
+    for raw_line in process.stdout:
+        line = raw_line.rstrip("\n")
+        if line.startswith(RECORD_SEPARATOR):
+            if commit:
+                yield commit
+            sha, author, email, timestamp, subject = line[1:].split(
+                FIELD_SEPARATOR, 4
+            )
+            commit = {
+                "sha": sha,
+                "author": author,
+                "email": email,
+                "time": int(timestamp),
+                "subject": subject,
+                "files": [],
+            }
+        elif line and commit:
+            insertions, deletions, path = line.split("\t", 2)
+            commit["files"].append(
+                (
+                    renamed_path(path),
+                    int(insertions) if insertions.isdigit() else 0,
+                    int(deletions) if deletions.isdigit() else 0,
+                )
+            )
+    if commit:
+        yield commit
+    if process.wait():
+        raise subprocess.CalledProcessError(process.returncode, "git log")
+
+
+def build_segment(commits: list[dict], segment_folder: str):
+    """Save commits into new segment folder, commits are sorted by commit time"""
+    commits = sorted(commits, key=lambda commit: commit["time"])
+    paths = sorted(
+        {path for commit in commits for path, _, _ in commit["files"]}
+    )
+    path_ids = {path: path_id for path_id, path in enumerate(paths)}
+    postings = sorted(
+        (path_ids[path], index)
+        for index, commit in enumerate(commits)
+        for path, _, _ in commit["files"]
+    )
+
+    tmp_folder = f"{segment_folder}.tmp"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+
+    def write_blob(name: str, values: list[bytes]):
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in values], out=offsets[1:])
+        with open(os.path.join(tmp_folder, f"{name}.bin"), "wb") as file:
+            file.writelines(values)
+        np.save(os.path.join(tmp_folder, f"{name}_offsets.npy"), offsets)
+
+    write_blob(
+        "commits",
+        [
+            json.dumps(
+                {
+                    "sha": commit["sha"],
+                    "author": commit["author"],
+                    "email": commit["email"],
+                    "time": commit["time"],
+                    "subject": commit["subject"],
+                    "files": len(commit["files"]),
+                    "insertions": sum(ins for _, ins, _ in commit["files"]),
+                    "deletions": sum(dels for _, _, dels in commit["files"]),
+                    "paths": [path for path, _, _ in commit["files"]],
+                },
+                ensure_ascii=False,
+            ).encode("utf-8")
+            for commit in commits
+        ],
+    )
+    write_blob("paths", [path.encode("utf-8") for path in paths])
+    path_offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(
+            np.array([path_id for path_id, _ in postings], dtype=np.int64),
+            minlength=len(paths),
+        ),
+        out=path_offsets[1:],
+    )
+    arrays = {
+        "commit_times": np.array(
+            [commit["time"] for commit in commits], dtype=np.int64
+        ),
+        "path_commit_offsets": path_offsets,
+        "path_commits": np.array(
+            [index for _, index in postings], dtype=np.int32
+        ),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_folder, f"{name}.npy"), array)
+
+    os.replace(tmp_folder, segment_folder)
+
+
+def _load_blob(folder: str, name: str) -> tuple[np.ndarray, np.ndarray]:
+    path = os.path.join(folder, f"{name}.bin")
+    data = (
+        np.memmap(path, dtype=np.uint8, mode="r")
+        if os.path.getsize(path)
+        else np.empty(0, dtype=np.uint8)
+    )
+    offsets = np.load(
+        os.path.join(folder, f"{name}_offsets.npy"), mmap_mode="r"
+    )
+    return data, offsets
+
+
+class _BlobList(Sequence):
+    """Lazy list of strings in memory-mapped blob, used to binary search sorted paths"""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+
+class CodeChangeSegment:
+    """Read only view of one index segment, all arrays are memory-mapped"""
+
+    def __init__(self, repo: str, folder: str):
+        self.repo = repo
+        self.folder = folder
+        self.commits = _BlobList(*_load_blob(folder, "commits"))
+        self.paths = _BlobList(*_load_blob(folder, "paths"))
+        self.commit_times = np.load(
+            os.path.join(folder, "commit_times.npy"), mmap_mode="r"
+        )
+        self.path_commit_offsets = np.load(
+            os.path.join(folder, "path_commit_offsets.npy"), mmap_mode="r"
+        )
+        self.path_commits = np.load(
+            os.path.join(folder, "path_commits.npy"), mmap_mode="r"
+        )
+
+    def find(
+        self,
+        start_time: int | None,
+        end_time: int | None,
+        path_prefix: str | None,
+    ) -> np.ndarray:
+        """Get indexes of commits in time range and touched paths with given prefix"""
+        low = (
+            0
+            if start_time is None
+            else int(np.searchsorted(self.commit_times, start_time, "left"))
+        )
+        high = (
+            len(self.commit_times)
+            if end_time is None
+            else int(np.searchsorted(self.commit_times, end_time, "right"))
+        )
+        if not path_prefix:
+            return np.arange(low, high)
+        # Paths with same prefix are next to each other in sorted path list
+        first_path = bisect.bisect_left(self.paths, path_prefix)
+        last_path = bisect.bisect_left(self.paths, path_prefix + "\U0010ffff")
+        commits = np.unique(
+            self.path_commits[
+                self.path_commit_offsets[first_path] : self.path_commit_offsets[
+                    last_path
+                ]
+            ]
+        )
+        return commits[(commits >= low) & (commits < high)]
+
+    def commit(self, index: int) -> dict:
+        return {"repo": self.repo, **json.loads(self.commits[index])}
+
+
+class CodeChangeIndex:
+    """Code change index of all configured repositories, manifest tracks last indexed commit
+    and segments of each repository. Readers use immutable segment list swapped under lock"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._opened = False
+        self._manifest: dict[str, dict] = {}
+        self._segments: list[CodeChangeSegment] = []
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.folder, "manifest.json")
+
+    def open(self):
+        with self._lock:
+            if self._opened:
+                return
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path) as file:
+                    self._manifest = json.load(file)
+            self._segments = [
+                CodeChangeSegment(repo, os.path.join(self.folder, segment))
+                for repo, entry in self._manifest.items()
+                for segment in entry["segments"]
+            ]
+            self._opened = True
+
+    def _save_manifest(self, manifest: dict):
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, self.manifest_path)
+
+    def update_repository(self, repo: str) -> int:
+        """Index commits of repository since last indexed one, return number of new commits.
+        History rewritten since last run is indexed again from scratch"""
+        self.open()
+        head = run_git(repo, "rev-parse", "HEAD").strip()
+        entry = self._manifest.get(repo, {"last_commit": None, "segments": []})
+        if entry["last_commit"] == head:
+            return 0
+        last_commit = entry["last_commit"]
+        if last_commit:
+            try:
+                run_git(repo, "merge-base", "--is-ancestor", last_commit, head)
+            except subprocess.CalledProcessError:
+                last_commit = None
+        previous_segments = [] if last_commit else entry["segments"]
+        segments = entry["segments"] if last_commit else []
+
+        commits = list(read_commits(repo, last_commit))
+        new_segments = []
+        if commits:
+            segment = f"segment-{uuid.uuid4().hex}"
+            build_segment(commits, os.path.join(self.folder, segment))
+            new_segments.append(segment)
+
+        with self._lock:
+            manifest = {
+                **self._manifest,
+                repo: {
+                    "last_commit": head,
+                    "segments": segments + new_segments,
+                },
+            }
+            self._save_manifest(manifest)
+            self._manifest = manifest
+            self._segments = [
+                segment
+                for segment in self._segments
+                if not (
+                    segment.repo == repo
+                    and os.path.basename(segment.folder) in previous_segments
+                )
+            ] + [
+                CodeChangeSegment(repo, os.path.join(self.folder, segment))
+                for segment in new_segments
+            ]
+        for segment in previous_segments:
+            shutil.rmtree(
+                os.path.join(self.folder, segment), ignore_errors=True
+            )
+        return len(commits)
+
+    def search(
+        self,
+        query: str = "",
+        start_time: int | None = None,
+        end_time: int | None = None,
+        path_prefix: str | None = None,
+        limit: int = 10,
+    ) -> list[dict]:
+        """Find commits in time range touching paths with given prefix, latest first. Latest
+        candidates are re-ranked by query keywords found in commit subject and paths"""
+        self.open()
+        candidates = []
+        for segment in self._segments:
+            indexes = segment.find(start_time, end_time, path_prefix)
+            indexes = indexes[-RANK_CANDIDATES_LIMIT:]
+            candidates.extend(
+                (int(segment.commit_times[index]), segment, int(index))
+                for index in indexes
+            )
+        candidates.sort(key=lambda candidate: -candidate[0])
+        terms = set(tokenize(query))
+        if not terms:
+            return [
+                segment.commit(index)
+                for _, segment, index in candidates[:limit]
+            ]
+        commits = [
+            segment.commit(index)
+            for _, segment, index in candidates[:RANK_CANDIDATES_LIMIT]
+        ]
+        commits.sort(
+            key=lambda commit: (
+                -len(
+                    terms.intersection(
+                        tokenize(
+                            f"{commit['subject']} {' '.join(commit['paths'])}"
+                        )
+                    )
+                )
+            )
+        )
+        return commits[:limit]
+
+    def stats(self) -> dict:
+        self.open()
+        return {
+            "repositories": len(self._manifest),
+            "segments": len(self._segments),
+            "commits": sum(len(segment.commits) for segment in self._segments),
+        }
+
+
+code_change_index = CodeChangeIndex(CODE_CHANGE_INDEX_FOLDER)
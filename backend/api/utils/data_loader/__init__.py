@@ -1,2 +1,2 @@
-from .pdf_loader import PDFLoader
+from .pdf_loader import PDFLoader, BatchSettings
 from .incident_doc_loader import IncidentDocLoader
@@ -1,61 +1,108 @@
-import io
+import asyncio
 import base64
+import json
+import os
+from collections.abc import Callable
+from concurrent.futures import Executor
 
 from langchain.storage import LocalFileStore
-from langchain.retrievers.multi_vector import MultiVectorRetriever
+from PIL import Image
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage
+from pydantic import BaseModel, Field
 from weaviate import WeaviateClient
-from pdf2image import convert_from_path
-from PIL import Image
+from weaviate.classes.query import Filter
 
 from api.utils.logger import logger
 from api.utils.id_generator import gen_document_id
 from api.utils.vs_weaviate_utils import (
     get_weaviate_store,
+    collection_has_property,
 )
 from api.utils.llm_google_utils import llm
-from api.utils.llm_prompts import image_summary_prompt
+from api.utils.llm_prompts import (
+    image_summary_prompt,
+    extract_info_from_images_prompt,
+)
+from api.utils.pdf_parsers import parse_incident_pdf
 
+# Common file extensions mapped to Pillow format names
+PAGE_FORMAT_ALIASES = {"jpg": "jpeg"}
 
-def create_doc_image(file_url: str):
-    try:
-        pdf_images = convert_from_path(file_url)
-        if not pdf_images:
-            return None
-
-        total_height = sum([image.height for image in pdf_images])
-        max_width = max([image.width for image in pdf_images])
-
-        merged_img = Image.new("RGB", (max_width, total_height))
-        y_offset = 0
-        for image in pdf_images:
-            merged_img.paste(image, (0, y_offset))
-            y_offset += image.height
-        buffer = io.BytesIO()
-        merged_img.save(buffer, format="PNG")
-        logger.info(f"Successfully create base64 image for PDF file {file_url}")
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
-    except Exception as e:
-        logger.exception(
-            f"Failed to generate image for PDF document {file_url}: {e}"
+
+def get_page_image_format(name: str) -> str:
+    """Normalize page image format name, fail at startup if Pillow can't save it"""
+    image_format = name.strip().lower()
+    image_format = PAGE_FORMAT_ALIASES.get(image_format, image_format)
+    Image.init()
+    if image_format.upper() not in Image.SAVE:
+        raise ValueError(
+            f"Unsupported INCIDENT_PAGE_FORMAT {name}, use jpeg or webp"
         )
-        raise
+    return image_format
+
+
+INCIDENT_PAGE_DPI = int(os.environ.get("INCIDENT_PAGE_DPI", "100"))
+# jpeg or webp
+INCIDENT_PAGE_FORMAT = get_page_image_format(
+    os.environ.get("INCIDENT_PAGE_FORMAT", "jpeg")
+)
+INCIDENT_PAGE_QUALITY = int(os.environ.get("INCIDENT_PAGE_QUALITY", "80"))
+# First pages normally include incident title and description, enough for summary
+SUMMARY_MAX_PAGES = 5
+ANALYSIS_MAX_PAGES = 10
+
+
+class IncidentAnalysis(BaseModel):
+    """Key information extracted from incident analysis document"""
 
+    title: str = Field(description="Incident title")
+    description: str = Field(description="Incident description")
+    root_cause: str = Field(description="Root cause analysis of incident")
 
-def gen_pdf_summary(pdf_url: str, image_base64: str) -> str:
+    def to_context(self) -> str:
+        return (
+            "Data source: incident analysis document\n"
+            f"Incident title: {self.title}\n"
+            f"Incident description: {self.description}\n"
+            f"Root cause analysis: {self.root_cause}"
+        )
+
+
+def manifest_key(doc_id: str) -> str:
+    return f"{doc_id}/manifest.json"
+
+
+def page_image_key(doc_id: str, page: int, image_format: str) -> str:
+    return f"{doc_id}/page-{page}.{image_format}"
+
+
+def analysis_key(doc_id: str) -> str:
+    return f"{doc_id}/analysis.json"
+
+
+def image_content(image_bytes: bytes, mime_type: str) -> dict:
+    """Build multimodal message content of one image"""
+    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+    return {
+        "type": "image_url",
+        "image_url": {"url": f"data:{mime_type};base64,{image_base64}"},
+    }
+
+
+async def gen_pdf_summary(
+    pdf_url: str, page_images: list[bytes], mime_type: str
+) -> str:
     try:
-        response = llm.invoke(
+        response = await llm.ainvoke(
             [
                 HumanMessage(
                     content=[
                         {"type": "text", "text": image_summary_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            },
-                        },
+                        *(
+                            image_content(image, mime_type)
+                            for image in page_images
+                        ),
                     ]
                 )
             ]
@@ -68,55 +115,212 @@ def gen_pdf_summary(pdf_url: str, image_base64: str) -> str:
         raise
 
 
+async def extract_incident_analysis(
+    page_images: list[bytes], mime_type: str
+) -> IncidentAnalysis | None:
+    """Use multimodal LLM to extract title, description and root cause from document page images,
+    None if LLM returned no structured output"""
+    structured_llm = llm.with_structured_output(IncidentAnalysis)
+    return await structured_llm.ainvoke(
+        [
+            ("system", extract_info_from_images_prompt),
+            (
+                "human",
+                [image_content(image, mime_type) for image in page_images],
+            ),
+        ]
+    )
+
+
 class IncidentDocLoader:
     """Incident summary document loader, use LLM to summarize Incident summary document
-    and put summary into vector DB, put original incident summary document in object store.
-    Then later we can use multi-vector retrieval to load original incident summary document"""
+    and put summary into vector DB, put original incident summary document pages as compressed
+    images in object store. Page texts are indexed too, later we use summary to find the document
+    and page texts to pick only query relevant pages to feed into LLM"""
 
     def __init__(
         self,
         object_store: LocalFileStore,
         client: WeaviateClient,
         summary_collection_name: str,
+        page_collection_name: str,
+        executor: Executor | None = None,
     ):
         self.object_store = object_store
         self.client = client
         self.summary_collection_name = summary_collection_name
+        self.page_collection_name = page_collection_name
+        self.executor = executor
+
+    def find_document_ids(self, file_url: str) -> set[str]:
+        """Get ids of all loaded versions of given incident document"""
+        if not collection_has_property(
+            self.client, self.summary_collection_name, "source"
+        ):
+            return set()
+        collection = self.client.collections.get(self.summary_collection_name)
+        response = collection.query.fetch_objects(
+            filters=Filter.by_property("source").equal(file_url),
+            return_properties=["doc_id"],
+        )
+        return {obj.properties["doc_id"] for obj in response.objects}
+
+    def find_legacy_document_ids(self) -> set[str]:
+        """Get ids of documents loaded before summaries had source and manifest. They can't be
+        matched to their file so they are never replaced, and can't be read without manifest"""
+        if not self.client.collections.exists(self.summary_collection_name):
+            return set()
+        has_source = collection_has_property(
+            self.client, self.summary_collection_name, "source"
+        )
+        collection = self.client.collections.get(self.summary_collection_name)
+        return {
+            obj.properties["doc_id"]
+            for obj in collection.iterator(
+                return_properties=["doc_id", "source"]
+                if has_source
+                else ["doc_id"]
+            )
+            if not obj.properties.get("source")
+        }
 
-    def load(self, file_url: str) -> bool:
+    def remove_legacy_documents(self) -> int:
+        """Remove legacy documents, their files are loaded again in current format. Return number
+        removed"""
+        doc_ids = self.find_legacy_document_ids()
+        if doc_ids:
+            logger.info(f"Remove {len(doc_ids)} legacy incident documents")
+            self.remove_documents(list(doc_ids))
+        return len(doc_ids)
+
+    def remove_documents(self, doc_ids: list[str]):
+        """Remove summaries, page texts and stored pages of given incident documents"""
+        for collection_name in (
+            self.summary_collection_name,
+            self.page_collection_name,
+        ):
+            if self.client.collections.exists(collection_name):
+                self.client.collections.get(collection_name).data.delete_many(
+                    where=Filter.by_property("doc_id").contains_any(doc_ids)
+                )
+        for doc_id in doc_ids:
+            manifest = self.object_store.mget([manifest_key(doc_id)])[0]
+            if manifest is None:
+                # Legacy document image is stored under document id
+                self.object_store.mdelete([doc_id])
+                continue
+            manifest = json.loads(manifest)
+            self.object_store.mdelete(
+                [
+                    page_image_key(doc_id, page, manifest["image_format"])
+                    for page in range(manifest["pages"])
+                ]
+                + [manifest_key(doc_id), analysis_key(doc_id)]
+            )
+
+    async def load(
+        self,
+        file_url: str,
+        on_progress: Callable[[int, int], None] | None = None,
+    ) -> bool:
+        """Load incident document, on_progress is called with (pages, chunks) once loaded"""
         summary_vector_store = get_weaviate_store(
             self.client, self.summary_collection_name
         )
+        page_vector_store = get_weaviate_store(
+            self.client, self.page_collection_name
+        )
+        mime_type = f"image/{INCIDENT_PAGE_FORMAT}"
         try:
-            image_base64 = create_doc_image(file_url)
-            if not image_base64:
+            # Rasterizing PDF is CPU bound, keep it out of event loop
+            loop = asyncio.get_running_loop()
+            page_texts, page_images = await loop.run_in_executor(
+                self.executor,
+                parse_incident_pdf,
+                file_url,
+                INCIDENT_PAGE_DPI,
+                INCIDENT_PAGE_FORMAT,
+                INCIDENT_PAGE_QUALITY,
+            )
+            if not page_images:
                 logger.error(f"Failed to get image from PDF file {file_url}")
                 return False
-            summary = gen_pdf_summary(file_url, image_base64)
+            logger.info(
+                f"Successfully rendered {len(page_images)} pages of PDF file {file_url}"
+            )
+            summary = await gen_pdf_summary(
+                file_url, page_images[:SUMMARY_MAX_PAGES], mime_type
+            )
             if not summary:
                 logger.error(f"Got empty summary from PDF file {file_url}")
                 return False
 
             id_key = "doc_id"
             doc_id = gen_document_id()
-            document = Document(
-                page_content=summary,
-                metadata={id_key: doc_id},
-            )
-            multi_retriever = MultiVectorRetriever(
-                vectorstore=summary_vector_store,
-                docstore=self.object_store,
-                id_key=id_key,
+            manifest = {
+                "file_name": file_url.rsplit("/", 1)[-1],
+                "pages": len(page_images),
+                "image_format": INCIDENT_PAGE_FORMAT,
+                "mime_type": mime_type,
+            }
+            stored_items = [
+                (page_image_key(doc_id, page, INCIDENT_PAGE_FORMAT), image)
+                for page, image in enumerate(page_images)
+            ]
+            stored_items.append(
+                (manifest_key(doc_id), json.dumps(manifest).encode())
             )
+            # Extract analysis once at ingest time, so queries don't need multimodal LLM call.
+            # If it failed here, it will be extracted lazily on first access
+            try:
+                analysis = await extract_incident_analysis(
+                    page_images[:ANALYSIS_MAX_PAGES], mime_type
+                )
+                if analysis is not None:
+                    stored_items.append(
+                        (
+                            analysis_key(doc_id),
+                            analysis.model_dump_json().encode(),
+                        )
+                    )
+            except Exception as e:
+                logger.warning(
+                    f"Failed to extract analysis from PDF file {file_url}: {e}"
+                )
+            await self.object_store.amset(stored_items)
 
-            # Add image and summary into multi-vector retriever, later use summary to retrieve image then feed into LLM
-            multi_retriever.vectorstore.add_documents([document])
-            image_bytes = base64.b64decode(image_base64)
-            multi_retriever.docstore.mset([(doc_id, image_bytes)])
+            # Summary is used to find document, page texts to find relevant pages in it
+            previous_doc_ids = await asyncio.to_thread(
+                self.find_document_ids, file_url
+            )
+            await summary_vector_store.aadd_documents(
+                [
+                    Document(
+                        page_content=summary,
+                        metadata={id_key: doc_id, "source": file_url},
+                    )
+                ]
+            )
+            page_documents = [
+                Document(
+                    page_content=text, metadata={id_key: doc_id, "page": page}
+                )
+                for page, text in enumerate(page_texts)
+                if text.strip()
+            ]
+            if page_documents:
+                await page_vector_store.aadd_documents(page_documents)
+            # Changed document is loaded as new version, remove previous one once new one is ready
+            if previous_doc_ids:
+                await asyncio.to_thread(
+                    self.remove_documents, list(previous_doc_ids)
+                )
         except Exception as e:
             logger.exception(
                 f"Failed to load incident analysis file {file_url}: {e}"
             )
             return False
 
+        if on_progress:
+            on_progress(len(page_images), 1 + len(page_documents))
         return True
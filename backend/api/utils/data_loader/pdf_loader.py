@@ -1,46 +1,190 @@
 """Load PDF file, chunk, indexing and save them into vector database, later used for information retrieval"""
 
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import Executor
+from dataclasses import dataclass
+
+from langchain_core.documents import Document
 from weaviate import WeaviateClient
+from weaviate.classes.query import Filter
+from weaviate.util import generate_uuid5
 
-from api.utils.vs_weaviate_utils import get_weaviate_store
+from api.utils.vs_weaviate_utils import (
+    get_weaviate_store,
+    collection_has_property,
+)
+from api.utils.hash_file import get_chunk_hash
+from api.utils.llm_google_utils import embedding_function
+from api.utils.pdf_parsers import parse_pdf_file
 from api.utils.logger import logger
 
+
+@dataclass(frozen=True)
+class BatchSettings:
+    """Batch sizes and concurrency of chunk embedding and writing"""
+
+    embed_batch_size: int = 100
+    embed_concurrency: int = 4
+    write_batch_size: int = 200
+
+
 class PDFLoader:
-    """PDF file loader, load PDF file contents into vector DB"""
+    """PDF file loader, load PDF file contents into vector DB. Parsing runs in given executor,
+    chunks are embedded in bounded concurrent batches and written with Weaviate batch API.
+    Chunks are identified by file and content hash, so reloading changed file only embeds new or
+    modified chunks and deletes removed ones"""
+
+    FETCH_PAGE_SIZE = 1000
 
-    def __init__(self, client: WeaviateClient, collection_name: str):
+    def __init__(
+        self,
+        client: WeaviateClient,
+        collection_name: str,
+        executor: Executor | None = None,
+        batch_settings: BatchSettings | None = None,
+    ):
+        if batch_settings is None:
+            batch_settings = BatchSettings()
         self.client = client
         self.collection_name = collection_name
+        self.executor = executor
+        self.embed_batch_size = batch_settings.embed_batch_size
+        self.write_batch_size = batch_settings.write_batch_size
+        self._embed_semaphore = asyncio.Semaphore(
+            batch_settings.embed_concurrency
+        )
+
+    async def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        async with self._embed_semaphore:
+            return await embedding_function.aembed_documents(texts)
+
+    async def embed_documents(self, docs: list[Document]) -> list[list[float]]:
+        texts = [doc.page_content for doc in docs]
+        batches = await asyncio.gather(
+            *(
+                self._embed_batch(texts[i : i + self.embed_batch_size])
+                for i in range(0, len(texts), self.embed_batch_size)
+            )
+        )
+        return [vector for batch in batches for vector in batch]
+
+    @staticmethod
+    def chunk_id(file_url: str, doc: Document) -> str:
+        return str(generate_uuid5(f"{file_url}:{doc.metadata['chunk_hash']}"))
+
+    def fetch_existing_chunk_ids(self, chunk_ids: list[str]) -> set[str]:
+        """Get which of given chunk ids are already in vector DB. Chunks are looked up by id
+        rather than paged by file, Weaviate caps offset paging and cursor can't be filtered"""
+        if not collection_has_property(
+            self.client, self.collection_name, "source"
+        ):
+            return set()
+        collection = self.client.collections.get(self.collection_name)
+        existing_ids = set()
+        for i in range(0, len(chunk_ids), self.FETCH_PAGE_SIZE):
+            batch = chunk_ids[i : i + self.FETCH_PAGE_SIZE]
+            response = collection.query.fetch_objects(
+                filters=Filter.by_id().contains_any(batch),
+                limit=len(batch),
+                return_properties=[],
+            )
+            existing_ids.update(str(obj.uuid) for obj in response.objects)
+        return existing_ids
 
-    async def load(self, file_url: str) -> bool:
-        vector_store = get_weaviate_store(self.client, self.collection_name)
+    def delete_removed_chunks(self, file_url: str, chunk_ids: list[str]) -> int:
+        """Delete chunks of given file which are not in given chunk ids, return number deleted.
+        Single delete call is capped by Weaviate query limit, so it repeats until nothing
+        matches"""
+        if not collection_has_property(
+            self.client, self.collection_name, "source"
+        ):
+            return 0
+        collection = self.client.collections.get(self.collection_name)
+        removed_filter = Filter.by_property("source").equal(file_url)
+        if chunk_ids:
+            removed_filter = removed_filter & Filter.by_id().contains_none(
+                chunk_ids
+            )
+        deleted = 0
+        while True:
+            result = collection.data.delete_many(where=removed_filter)
+            deleted += result.successful
+            if result.matches == 0 or result.successful == 0:
+                return deleted
+
+    def write_documents(
+        self, docs: list[Document], vectors: list[list[float]], ids: list[str]
+    ) -> int:
+        """Write chunks with their vectors through Weaviate batch API, return number of failed objects"""
+        # Vector store creates collection with expected schema if it does not exist yet
+        get_weaviate_store(self.client, self.collection_name)
+        collection = self.client.collections.get(self.collection_name)
+        with collection.batch.fixed_size(
+            batch_size=self.write_batch_size
+        ) as batch:
+            for doc, vector, chunk_id in zip(docs, vectors, ids):
+                batch.add_object(
+                    properties={"text": doc.page_content, **doc.metadata},
+                    vector=vector,
+                    uuid=chunk_id,
+                )
+        return len(collection.batch.failed_objects)
+
+    async def load(
+        self,
+        file_url: str,
+        on_progress: Callable[[int, int], None] | None = None,
+    ) -> bool:
+        """Load PDF file into vector DB, on_progress is called with (pages, chunks) once loaded"""
         try:
-            loader = PyMuPDFLoader(
-                file_path=file_url,
-                mode="page",
-                extract_tables="markdown",
+            loop = asyncio.get_running_loop()
+            docs = await loop.run_in_executor(
+                self.executor, parse_pdf_file, file_url
             )
-            raw_docs =loader.load()
-            logger.info(f"Load {len(raw_docs)} pages from pdf file {file_url}")
+            logger.info(f"Load {len(docs)} chunks from pdf file {file_url}")
 
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=50, separators=["\n", "."])
-            docs = text_splitter.split_documents(raw_docs)
+            chunks = {}
+            for doc in docs:
+                doc.metadata["source"] = file_url
+                doc.metadata["chunk_hash"] = get_chunk_hash(doc.page_content)
+                chunks.setdefault(self.chunk_id(file_url, doc), doc)
+            existing_ids = await asyncio.to_thread(
+                self.fetch_existing_chunk_ids, list(chunks)
+            )
+            new_ids = [
+                chunk_id for chunk_id in chunks if chunk_id not in existing_ids
+            ]
+            new_docs = [chunks[chunk_id] for chunk_id in new_ids]
 
-            await vector_store.aadd_documents(
-                documents=docs,
+            vectors = await self.embed_documents(new_docs)
+            failed_count = await asyncio.to_thread(
+                self.write_documents, new_docs, vectors, new_ids
+            )
+            if failed_count:
+                logger.error(
+                    f"Failed to write {failed_count} chunks of pdf file {file_url} in to vector DB"
+                )
+                return False
+            # Delete removed chunks only after new ones are written, so file is never missing
+            removed_count = await asyncio.to_thread(
+                self.delete_removed_chunks, file_url, list(chunks)
+            )
+            logger.info(
+                f"Successfully loaded pdf file {file_url} in to vector DB, "
+                f"{len(new_docs)} chunks added, {removed_count} removed, "
+                f"{len(chunks) - len(new_docs)} unchanged"
             )
-            logger.info(f"Successfully loaded pdf file {file_url} in to vector DB")
+            if on_progress:
+                pages = {doc.metadata.get("page") for doc in new_docs}
+                on_progress(len(pages), len(new_docs))
             return True
         except Exception as e:
-            logger.exception(f"Failed to load pdf file {file_url} in to vector DB: {e}")
+            logger.exception(
+                f"Failed to load pdf file {file_url} in to vector DB: {e}"
+            )
             return False
 
     async def load_files(self, files: list[str]):
         for file_url in files:
             await self.load(file_url)
-
-
-
-
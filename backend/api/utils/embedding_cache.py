@@ -0,0 +1,198 @@
+"""Content addressed embedding cache, in-memory LRU tier in front of SQLite on-disk store"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from api.utils.logger import logger
+
+SQLITE_MAX_VARIABLES = 500
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespaces, so same text with different layout share one embedding"""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Embedding vectors keyed by hash of (model name, task type, normalized text)"""
+
+    def __init__(self, db_path: str, max_memory_entries: int):
+        self.max_memory_entries = max_memory_entries
+        self._memory: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        db_folder = os.path.dirname(db_path)
+        if db_folder:
+            os.makedirs(db_folder, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, task_type: str, text: str) -> str:
+        content = f"{model}\x00{task_type}\x00{normalize_text(text)}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: list[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        """Look up keys in memory first, then on disk, missing keys are not in result"""
+        found = {}
+        with self._lock:
+            disk_keys = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is None:
+                    disk_keys.append(key)
+                else:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.memory_hits += 1
+
+            # Keep number of SQL variables under SQLite limit for large ingestion batches
+            for start in range(0, len(disk_keys), SQLITE_MAX_VARIABLES):
+                batch_keys = disk_keys[start : start + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(batch_keys))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch_keys,
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self._remember(key, vector)
+                    found[key] = vector
+                self.disk_hits += len(rows)
+                self.misses += len(batch_keys) - len(rows)
+        return found
+
+    def set_many(self, items: dict[str, list[float]]):
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in items.items()
+                ],
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                (self.memory_hits + self.disk_hits) / lookups
+                if lookups
+                else None
+            ),
+            "memory_entries": len(self._memory),
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper, only texts not found in cache are sent to underlying embedding API"""
+
+    def __init__(
+        self, embeddings: Embeddings, model: str, cache: EmbeddingCache
+    ):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def _split(
+        self, texts: list[str], task_type: str
+    ) -> tuple[list[str], dict[str, list[float]], dict[str, str]]:
+        keys = [
+            self.cache.make_key(self.model, task_type, text) for text in texts
+        ]
+        cached = self.cache.get_many(list(dict.fromkeys(keys)))
+        # Deduplicate missing texts, same text only embedded once in a batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        return keys, cached, missing
+
+    def _merge(
+        self,
+        keys: list[str],
+        cached: dict[str, list[float]],
+        missing: dict[str, str],
+        vectors: list[list[float]],
+    ) -> list[list[float]]:
+        new_items = dict(zip(missing.keys(), vectors))
+        if new_items:
+            try:
+                self.cache.set_many(new_items)
+            except Exception as e:
+                logger.warning(f"Failed to save embeddings into cache: {e}")
+        cached.update(new_items)
+        return [cached[key] for key in keys]
+
+    def embed_documents(self, texts: list[str], **kwargs) -> list[list[float]]:
+        task_type = kwargs.get("task_type") or "retrieval_document"
+        keys, cached, missing = self._split(texts, task_type)
+        vectors = []
+        if missing:
+            vectors = self.embeddings.embed_documents(
+                list(missing.values()), **kwargs
+            )
+        return self._merge(keys, cached, missing, vectors)
+
+    def embed_query(self, text: str, **kwargs) -> list[float]:
+        task_type = kwargs.get("task_type") or "retrieval_query"
+        keys, cached, missing = self._split([text], task_type)
+        vectors = []
+        if missing:
+            vectors = [self.embeddings.embed_query(text, **kwargs)]
+        return self._merge(keys, cached, missing, vectors)[0]
+
+    async def aembed_documents(
+        self, texts: list[str], **kwargs
+    ) -> list[list[float]]:
+        task_type = kwargs.get("task_type") or "retrieval_document"
+        keys, cached, missing = await asyncio.to_thread(
+            self._split, texts, task_type
+        )
+        vectors = []
+        if missing:
+            vectors = await self.embeddings.aembed_documents(
+                list(missing.values()), **kwargs
+            )
+        return await asyncio.to_thread(
+            self._merge, keys, cached, missing, vectors
+        )
+
+    async def aembed_query(self, text: str, **kwargs) -> list[float]:
+        task_type = kwargs.get("task_type") or "retrieval_query"
+        keys, cached, missing = await asyncio.to_thread(
+            self._split, [text], task_type
+        )
+        vectors = []
+        if missing:
+            vectors = [await self.embeddings.aembed_query(text, **kwargs)]
+        result = await asyncio.to_thread(
+            self._merge, keys, cached, missing, vectors
+        )
+        return result[0]
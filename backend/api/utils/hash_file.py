@@ -1,11 +1,28 @@
 import hashlib
+import os
+
+# Large buffered reads, hashing cost is dominated by syscalls with small buffers
+HASH_BUFFER_SIZE = 1024 * 1024
 
 
 def get_file_hash(file_url: str) -> str:
-    with open(file_url, "rb") as file:
-        file_hash = hashlib.md5()
-        # consider file can be huge, so break into 8192 bytes chunks
-        while chunk := file.read(8192):
-            file_hash.update(chunk)
+    with open(file_url, "rb", buffering=0) as file:
+        file_hash = hashlib.blake2b(digest_size=32)
+        buffer = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        # consider file can be huge, so read it into reused buffer chunk by chunk
+        while size := file.readinto(buffer):
+            file_hash.update(view[:size])
 
     return file_hash.hexdigest()
+
+
+def get_file_stat(file_url: str) -> tuple[int, int]:
+    """Get file size and modification time in nanoseconds, used as fast path to detect changed files"""
+    stat = os.stat(file_url)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def get_chunk_hash(text: str) -> str:
+    """Content hash of one document chunk"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
@@ -0,0 +1,430 @@
+"""Embedded search engine of historical incident records. Records exported as JSONL or CSV are
+indexed into BM25 ranked inverted index saved as memory-mapped NumPy arrays, one segment per
+exported file, so only new or changed files are indexed again and opening index reads nearly
+nothing from disk"""
+
+import csv
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import uuid
+from datetime import UTC, datetime
+
+import numpy as np
+
+HISTORICAL_INCIDENTS_FOLDER = os.environ.get(
+    "HISTORICAL_INCIDENTS_FOLDER", "./data/historical_incidents"
+)
+HISTORICAL_INCIDENT_INDEX_FOLDER = os.environ.get(
+    "HISTORICAL_INCIDENT_INDEX_FOLDER", "./data/index/historical_incidents"
+)
+INCIDENT_RECORD_SUFFIXES = (".jsonl", ".csv")
+
+TEXT_FIELDS = ("title", "description", "root_cause", "resolution", "service")
+# Accepted column names of exported records, first one is the name used in index
+FIELD_ALIASES = {
+    "id": ("id", "incident_id", "number"),
+    "title": ("title", "summary", "short_description"),
+    "description": ("description", "details"),
+    "service": ("service", "service_name", "component"),
+    "severity": ("severity", "priority"),
+    "started_at": ("started_at", "start_time", "created_at", "opened_at"),
+    "resolved_at": ("resolved_at", "end_time", "closed_at"),
+    "root_cause": ("root_cause", "cause"),
+    "resolution": ("resolution", "fix", "remediation"),
+}
+MISSING_TIME = np.iinfo(np.int64).min
+TERM_MAX_LENGTH = 32
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._:/-][a-z0-9]+)*")
+TOKEN_SEPARATORS = re.compile(r"[._:/-]")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens, compound tokens like error codes, metric names and service ids
+    are kept as whole and also split into their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token[:TERM_MAX_LENGTH])
+        parts = TOKEN_SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.extend(part[:TERM_MAX_LENGTH] for part in parts)
+    return tokens
+
+
+def parse_timestamp(value) -> int | None:
+    """Parse epoch seconds or ISO 8601 time into epoch seconds, naive time is taken as UTC"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, int | float):
+        seconds = value
+    else:
+        value = str(value).strip()
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                parsed = datetime.fromisoformat(value)
+            except ValueError:
+                return None
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=UTC)
+            return int(parsed.timestamp())
+    # Epoch out of datetime range, like inf, nan or corrupt value, is treated as missing
+    try:
+        datetime.fromtimestamp(seconds, UTC)
+    except (OverflowError, OSError, ValueError):
+        return None
+    return int(seconds)
+
+
+def normalize_record(raw: dict) -> dict:
+    record = {}
+    for field, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            value = raw.get(alias)
+            if value not in (None, ""):
+                record[field] = value
+                break
+    return record
+
+
+def read_incident_records(file_url: str):
+    """Read exported incident records from JSONL or CSV file one by one"""
+    with open(file_url, encoding="utf-8", newline="") as file:
+        if file_url.endswith(".csv"):
+            for row in csv.DictReader(file):
+                yield normalize_record(row)
+        else:
+            for line in file:
+                if line.strip():
+                    yield normalize_record(json.loads(line))
+
+
+def build_segment(file_url: str, segment_folder: str) -> int:
+    """Index all records of one exported file into new segment folder, return number of records"""
+    term_ids = {}
+    posting_terms = []
+    posting_docs = []
+    posting_tfs = []
+    doc_lengths = []
+    started_at = []
+    services = {}
+    service_ids = []
+    record_offsets = [0]
+
+    tmp_folder = f"{segment_folder}.tmp"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    with open(os.path.join(tmp_folder, "records.bin"), "wb") as records_file:
+        for doc, record in enumerate(read_incident_records(file_url)):
+            tokens = tokenize(
+                " ".join(str(record.get(field, "")) for field in TEXT_FIELDS)
+            )
+            term_freqs = {}
+            for token in tokens:
+                term_freqs[token] = term_freqs.get(token, 0) + 1
+            for term, tf in term_freqs.items():
+                posting_terms.append(term_ids.setdefault(term, len(term_ids)))
+                posting_docs.append(doc)
+                posting_tfs.append(tf)
+            doc_lengths.append(len(tokens))
+
+            timestamp = parse_timestamp(record.get("started_at"))
+            started_at.append(MISSING_TIME if timestamp is None else timestamp)
+            service = str(record.get("service", "")).strip().lower()
+            service_ids.append(services.setdefault(service, len(services)))
+
+            encoded = json.dumps(record, ensure_ascii=False).encode("utf-8")
+            records_file.write(encoded)
+            record_offsets.append(record_offsets[-1] + len(encoded))
+
+    # Renumber terms in sorted order, so terms can be looked up with binary search
+    terms = np.array(list(term_ids), dtype=f"U{TERM_MAX_LENGTH}")
+    term_order = np.argsort(terms, kind="stable")
+    term_rank = np.empty_like(term_order)
+    term_rank[term_order] = np.arange(len(term_order))
+    posting_terms = term_rank[np.array(posting_terms, dtype=np.int64)]
+    posting_order = np.argsort(posting_terms, kind="stable")
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(posting_terms, minlength=len(terms)), out=term_offsets[1:]
+    )
+
+    arrays = {
+        "terms": terms[term_order],
+        "term_offsets": term_offsets,
+        "posting_docs": np.array(posting_docs, dtype=np.int32)[posting_order],
+        "posting_tfs": np.minimum(
+            np.array(posting_tfs, dtype=np.int64), np.iinfo(np.uint16).max
+        ).astype(np.uint16)[posting_order],
+        "doc_lengths": np.array(doc_lengths, dtype=np.int32),
+        "started_at": np.array(started_at, dtype=np.int64),
+        "service_ids": np.array(service_ids, dtype=np.int32),
+        "record_offsets": np.array(record_offsets, dtype=np.int64),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_folder, f"{name}.npy"), array)
+    with open(os.path.join(tmp_folder, "services.json"), "w") as file:
+        json.dump(list(services), file)
+
+    shutil.rmtree(segment_folder, ignore_errors=True)
+    os.replace(tmp_folder, segment_folder)
+    return len(doc_lengths)
+
+
+class IndexSegment:
+    """Read only view of one index segment, all arrays are memory-mapped"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")
+
+        self.terms = load("terms")
+        self.term_offsets = load("term_offsets")
+        self.posting_docs = load("posting_docs")
+        self.posting_tfs = load("posting_tfs")
+        self.doc_lengths = load("doc_lengths")
+        self.started_at = load("started_at")
+        self.service_ids = load("service_ids")
+        self.record_offsets = load("record_offsets")
+        with open(os.path.join(folder, "services.json")) as file:
+            self.services = json.load(file)
+        records_path = os.path.join(folder, "records.bin")
+        self.records = (
+            np.memmap(records_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(records_path)
+            else np.empty(0, dtype=np.uint8)
+        )
+        self.doc_count = len(self.doc_lengths)
+        self.total_length = int(self.doc_lengths.sum())
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray] | None:
+        index = int(np.searchsorted(self.terms, term))
+        if index >= len(self.terms) or self.terms[index] != term:
+            return None
+        start, end = self.term_offsets[index], self.term_offsets[index + 1]
+        return self.posting_docs[start:end], self.posting_tfs[start:end]
+
+    def filter_mask(
+        self,
+        services: list[str] | None,
+        start_time: int | None,
+        end_time: int | None,
+    ) -> np.ndarray | None:
+        mask = None
+        if services:
+            wanted = [
+                service_id
+                for service_id, service in enumerate(self.services)
+                if service in services
+            ]
+            mask = np.isin(self.service_ids, wanted)
+        if start_time is not None or end_time is not None:
+            time_mask = self.started_at != MISSING_TIME
+            if start_time is not None:
+                time_mask &= self.started_at >= start_time
+            if end_time is not None:
+                time_mask &= self.started_at <= end_time
+            mask = time_mask if mask is None else mask & time_mask
+        return mask
+
+    def record(self, doc: int) -> dict:
+        start, end = self.record_offsets[doc], self.record_offsets[doc + 1]
+        return json.loads(self.records[start:end].tobytes())
+
+
+class HistoricalIncidentIndex:
+    """Historical incident search index made of segments, manifest tracks which exported file
+    each segment was built from. Readers use immutable segment list swapped under lock"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._opened = False
+        self._manifest: dict[str, dict] = {}
+        self._segments: dict[str, IndexSegment] = {}
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.folder, "manifest.json")
+
+    def open(self):
+        with self._lock:
+            if self._opened:
+                return
+            manifest = {}
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path) as file:
+                    manifest = json.load(file)
+            self._manifest = manifest
+            self._segments = {
+                source: IndexSegment(
+                    os.path.join(self.folder, entry["segment"])
+                )
+                for source, entry in manifest.items()
+            }
+            self._opened = True
+
+    def changed_sources(self, file_urls: list[str]) -> list[str]:
+        """Get exported files which are new or changed since they were indexed"""
+        self.open()
+        changed = []
+        for file_url in file_urls:
+            stat = os.stat(file_url)
+            entry = self._manifest.get(file_url)
+            if (
+                entry is None
+                or entry["size"] != stat.st_size
+                or entry["mtime_ns"] != stat.st_mtime_ns
+            ):
+                changed.append(file_url)
+        return changed
+
+    def _write_manifest(self, manifest: dict[str, dict]):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest = manifest
+
+    def remove_missing_sources(self) -> list[str]:
+        """Drop segments of exported files which no longer exist, return their sources"""
+        self.open()
+        with self._lock:
+            missing = [
+                source
+                for source in self._manifest
+                if not os.path.exists(source)
+            ]
+            if not missing:
+                return []
+            removed = [self._manifest[source] for source in missing]
+            self._write_manifest(
+                {
+                    source: entry
+                    for source, entry in self._manifest.items()
+                    if source not in missing
+                }
+            )
+            self._segments = {
+                source: segment
+                for source, segment in self._segments.items()
+                if source not in missing
+            }
+        for entry in removed:
+            shutil.rmtree(
+                os.path.join(self.folder, entry["segment"]), ignore_errors=True
+            )
+        return missing
+
+    def new_segment_folder(self) -> str:
+        return os.path.join(self.folder, f"segment-{uuid.uuid4().hex}")
+
+    def add_segment(self, file_url: str, segment_folder: str, records: int):
+        """Replace segment of given exported file with newly built one"""
+        self.open()
+        stat = os.stat(file_url)
+        segment = IndexSegment(segment_folder)
+        with self._lock:
+            manifest = dict(self._manifest)
+            previous = manifest.get(file_url)
+            manifest[file_url] = {
+                "segment": os.path.basename(segment_folder),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "records": records,
+            }
+            self._write_manifest(manifest)
+            self._segments = {**self._segments, file_url: segment}
+        # Old segment files stay readable through existing memory maps until they are closed
+        if previous:
+            shutil.rmtree(
+                os.path.join(self.folder, previous["segment"]),
+                ignore_errors=True,
+            )
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        services: list[str] | None = None,
+        start_time: int | None = None,
+        end_time: int | None = None,
+    ) -> list[tuple[float, dict]]:
+        """BM25 search of records, optionally only records of given services or started in
+        given time range. Return top k records with their scores"""
+        self.open()
+        segments = list(self._segments.values())
+        terms = list(dict.fromkeys(tokenize(query)))
+        doc_count = sum(segment.doc_count for segment in segments)
+        if not terms or not doc_count:
+            return []
+        avg_length = (
+            sum(segment.total_length for segment in segments) / doc_count or 1.0
+        )
+        if services:
+            services = [service.strip().lower() for service in services]
+
+        postings = [
+            [segment.postings(term) for term in terms] for segment in segments
+        ]
+        idfs = []
+        for term_index in range(len(terms)):
+            df = sum(
+                len(segment_postings[term_index][0])
+                for segment_postings in postings
+                if segment_postings[term_index] is not None
+            )
+            idfs.append(math.log(1 + (doc_count - df + 0.5) / (df + 0.5)))
+
+        results = []
+        for segment, segment_postings in zip(segments, postings):
+            if all(posting is None for posting in segment_postings):
+                continue
+            scores = np.zeros(segment.doc_count, dtype=np.float32)
+            for idf, posting in zip(idfs, segment_postings):
+                if posting is None:
+                    continue
+                docs, tfs = posting
+                tfs = tfs.astype(np.float32)
+                norm = BM25_K1 * (
+                    1 - BM25_B + BM25_B * segment.doc_lengths[docs] / avg_length
+                )
+                scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+            mask = segment.filter_mask(services, start_time, end_time)
+            if mask is not None:
+                scores[~mask] = 0
+            top = min(k, segment.doc_count)
+            candidates = np.argpartition(-scores, top - 1)[:top]
+            results.extend(
+                (float(scores[doc]), segment, int(doc))
+                for doc in candidates
+                if scores[doc] > 0
+            )
+
+        results.sort(key=lambda result: -result[0])
+        return [
+            (score, segment.record(doc)) for score, segment, doc in results[:k]
+        ]
+
+    def stats(self) -> dict:
+        self.open()
+        return {
+            "segments": len(self._manifest),
+            "records": sum(
+                entry["records"] for entry in self._manifest.values()
+            ),
+        }
+
+
+historical_incident_index = HistoricalIncidentIndex(
+    HISTORICAL_INCIDENT_INDEX_FOLDER
+)
@@ -1,14 +1,37 @@
 """All until classes and functions related to Google LLM"""
 
+import os
+
 from langchain_google_genai import (
     ChatGoogleGenerativeAI,
     GoogleGenerativeAIEmbeddings,
 )
 
+from api.utils.embedding_cache import EmbeddingCache, CachedEmbeddings
+from api.utils.tracing import tracing_callback_handler
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# Every LLM call made while handling request is traced with its token usage
 llm = ChatGoogleGenerativeAI(
-    model="gemini-2.0-flash", temperature=0.01, max_output_tokens=8192
+    model="gemini-2.0-flash",
+    temperature=0.01,
+    max_output_tokens=8192,
+    callbacks=[tracing_callback_handler],
+)
+
+embedding_cache = EmbeddingCache(
+    db_path=os.environ.get(
+        "EMBEDDING_CACHE_PATH", "./data/cache/embeddings.sqlite3"
+    ),
+    max_memory_entries=int(
+        os.environ.get("EMBEDDING_CACHE_MEMORY_SIZE", "10000")
+    ),
 )
 
-embedding_function = GoogleGenerativeAIEmbeddings(
-    model="models/text-embedding-004"
+# All embedding calls go through cache, repeated queries and unchanged chunks never hit embedding API again
+embedding_function = CachedEmbeddings(
+    embeddings=GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL),
+    model=EMBEDDING_MODEL,
+    cache=embedding_cache,
 )
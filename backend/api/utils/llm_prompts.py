@@ -13,10 +13,11 @@ issue since May 21st.
 """
 
 query_translation_prompt_template = """
-You are AI assistant. You task is to generate five different \
+You are AI assistant. You task is to generate {num_queries} different \
 versions of given query to retrieve relevant documents from a vector database. By \
 generating multiple perspectives on the user query, your goal is to help the user \
-overcome some of the limitations of the distance-based similarity search.
+overcome some of the limitations of the distance-based similarity search. Keep exact \
+error messages, metric names and service names of the query unchanged.
 Provide these alternative queries separated by newlines.
 Original Query: {query}"""
 
@@ -46,12 +47,15 @@ Answer:
 
 central_processor_system_prompt = """You are the central processor, the great AI decision maker.
 Given the user's query you must decide what to do with it based on the list of tools provided to \
-you, use any tool just one time in reasoning. \
+you, use any tool just one time in reasoning. If several tools are needed and they do not depend on each \
+other's outputs, call all of them together in one turn, they will run at the same time. \
 
 You should aim to collect enough information from all tools if needed before providing all relevant \
 information to the user. Once you have collection relevant information from all tools related to the \
 user's query (stored in the scratchpad), or you have used all tools searching all available data but still 
 can not find relevant information, then use the final_answer tool to generate final answer. 
+Earlier conversation with the user is given before the query. If it already contains information \
+needed for a follow-up query, do not call tools again to collect it, pass it as context to final_answer.
 """
 
 extract_info_from_images_prompt = """You are a advisor tasked with summarizing incident information from \
@@ -67,3 +71,14 @@ caused under some situations some KPI results will be NaN, which data type is no
 GraphQL schema. This eventually caused related GraphQL queries were rejected and frontend did \
 not get all report KPI results.
 """
+
+chat_summary_prompt_template = """You are an assistant to maintain a running summary of a conversation \
+between a user and an AI SRE assistant. Update the existing summary with new conversation turns. Keep \
+incidents, services, times, root causes, findings and open questions mentioned, drop greetings and \
+repeated details. Answer with the updated summary only, no longer than 200 words.
+
+Existing summary:
+{summary}
+
+New conversation turns:
+{turns}"""
@@ -1,22 +1,138 @@
-"""Customized logger including console and file handlers"""
+"""Customized logger including console and file handlers. Log calls only put records in queue,
+formatting and writing happen in background listener thread, so slow console or disk never
+blocks request handling. Records are JSON lines by default, long messages are capped and
+verbose records can be sampled"""
 
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 
-logger = logging.getLogger(__name__)
-logger.setLevel("DEBUG")
+# development or production, sets default log levels
+APP_ENV = os.environ.get("APP_ENV", "development").lower()
+LOG_LEVEL = os.environ.get(
+    "LOG_LEVEL", "DEBUG" if APP_ENV == "development" else "INFO"
+).upper()
+LOG_FILE_LEVEL = os.environ.get("LOG_FILE_LEVEL", "WARNING").upper()
+LOG_FILE = os.environ.get("LOG_FILE", "server.log")
+# json or text
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json").lower()
+# Messages longer than this are truncated, tracebacks are kept whole
+LOG_MAX_MESSAGE_CHARS = int(os.environ.get("LOG_MAX_MESSAGE_CHARS", "2000"))
+# Share of DEBUG and INFO records kept, warnings and errors are always kept
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
 
-formatter = logging.Formatter(
-    "{asctime} - {levelname} - {message}",
-    style="{",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+# Attributes every record has, anything else was passed with extra and is logged as field
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {
+    "message",
+    "asctime",
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format record as one JSON line, fields passed with extra are included"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep given share of records below WARNING"""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.sample_rate >= 1:
+            return True
+        return random.random() < self.sample_rate
+
+
+class CappedQueueHandler(logging.handlers.QueueHandler):
+    """Put records in queue with message merged and capped, tracebacks rendered to text. Records
+    are dropped when queue is full rather than blocking caller"""
+
+    def __init__(self, log_queue: queue.Queue, max_message_chars: int):
+        super().__init__(log_queue)
+        self.max_message_chars = max_message_chars
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        message = record.getMessage()
+        if len(message) > self.max_message_chars:
+            message = (
+                f"{message[: self.max_message_chars]}... "
+                f"[truncated {len(message) - self.max_message_chars} chars]"
+            )
+        record.msg = message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+if LOG_FORMAT == "json":
+    formatter = JsonFormatter(datefmt="%Y-%m-%dT%H:%M:%S%z")
+else:
+    formatter = logging.Formatter(
+        "{asctime} - {levelname} - {message}",
+        style="{",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
 
 console_handler = logging.StreamHandler()
-console_handler.setLevel("DEBUG")
+console_handler.setLevel(LOG_LEVEL)
 console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
 
-file_handler = logging.FileHandler("server.log", mode="a", encoding="utf-8")
-file_handler.setLevel("WARNING")
+file_handler = logging.FileHandler(LOG_FILE, mode="a", encoding="utf-8")
+file_handler.setLevel(LOG_FILE_LEVEL)
 file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+queue_handler = CappedQueueHandler(
+    queue.Queue(maxsize=LOG_QUEUE_SIZE), LOG_MAX_MESSAGE_CHARS
+)
+queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+
+logger = logging.getLogger(__name__)
+logger.setLevel(
+    min(logging.getLevelName(LOG_LEVEL), logging.getLevelName(LOG_FILE_LEVEL))
+)
+logger.addHandler(queue_handler)
+
+log_listener = logging.handlers.QueueListener(
+    queue_handler.queue,
+    console_handler,
+    file_handler,
+    respect_handler_level=True,
+)
+log_listener.start()
+# Flush queued records on interpreter exit
+atexit.register(log_listener.stop)
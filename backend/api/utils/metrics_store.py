@@ -0,0 +1,318 @@
+"""Local columnar time series store of exported application monitoring data. Every metric is
+saved as memory-mapped NumPy timestamp and value arrays sorted by time, queries slice the incident
+window with binary search and aggregate it with vectorized NumPy operations"""
+
+import csv
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from datetime import UTC, datetime
+
+import numpy as np
+
+from api.utils.historical_incident_index import parse_timestamp, tokenize
+
+MONITORING_DATA_FOLDER = os.environ.get(
+    "MONITORING_DATA_FOLDER", "./data/monitoring"
+)
+METRICS_STORE_FOLDER = os.environ.get(
+    "METRICS_STORE_FOLDER", "./data/index/metrics"
+)
+METRIC_RECORD_SUFFIXES = (".jsonl", ".csv")
+# Monotonic counters, summarized by their rate instead of raw values
+COUNTER_SUFFIXES = ("_total", "_count", "_sum")
+PERCENTILE_MAX_POINTS = 100_000
+CHANGE_POINT_BUCKETS = 2000
+# Shorter series are too short to compare means before and after split
+CHANGE_POINT_MIN_POINTS = 4
+# Mean shifts smaller than this ratio of mean before change are not reported
+CHANGE_POINT_MIN_SHIFT = 0.1
+UNSAFE_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_.-]")
+
+
+def metric_key(record: dict) -> str:
+    service = str(record.get("service") or "").strip()
+    metric = str(record["metric"]).strip()
+    return f"{service}/{metric}" if service else metric
+
+
+def read_metric_points(file_url: str):
+    """Read exported metric points (metric, timestamp, value, optional service) from JSONL or CSV"""
+    with open(file_url, encoding="utf-8", newline="") as file:
+        if file_url.endswith(".csv"):
+            records = csv.DictReader(file)
+        else:
+            records = (json.loads(line) for line in file if line.strip())
+        for record in records:
+            timestamp = parse_timestamp(record.get("timestamp"))
+            if timestamp is None or record.get("metric") in (None, ""):
+                continue
+            try:
+                value = float(record["value"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            yield metric_key(record), timestamp, value
+
+
+def _load_manifest(folder: str) -> dict:
+    manifest_path = os.path.join(folder, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return {"metrics": {}, "sources": {}}
+    with open(manifest_path) as file:
+        return json.load(file)
+
+
+def _load_series(folder: str, version: str) -> tuple[np.ndarray, np.ndarray]:
+    version_folder = os.path.join(folder, version)
+    return (
+        np.load(os.path.join(version_folder, "timestamps.npy"), mmap_mode="r"),
+        np.load(os.path.join(version_folder, "values.npy"), mmap_mode="r"),
+    )
+
+
+def _remove_unreferenced_versions(folder: str, manifest: dict):
+    """Remove version folders not referenced by manifest, like versions replaced by previous
+    ingestion or left by failed one"""
+    if not os.path.isdir(folder):
+        return
+    referenced = {entry["version"] for entry in manifest["metrics"].values()}
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name not in referenced and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def ingest_metric_files(folder: str, file_urls: list[str]) -> int:
+    """Merge points of exported files into store, return number of points read. Merged metrics are
+    written as new versions and published by replacing manifest, so readers never see half
+    written series. Points with same timestamp are deduplicated, latest one wins"""
+    manifest = _load_manifest(folder)
+    # Replaced versions are kept until next ingestion, readers may still use previous manifest
+    _remove_unreferenced_versions(folder, manifest)
+    new_points: dict[str, tuple[list[int], list[float]]] = {}
+    point_count = 0
+    for file_url in file_urls:
+        for key, timestamp, value in read_metric_points(file_url):
+            timestamps, values = new_points.setdefault(key, ([], []))
+            timestamps.append(timestamp)
+            values.append(value)
+            point_count += 1
+
+    for key, (new_timestamps, new_values) in new_points.items():
+        timestamps = np.array(new_timestamps, dtype=np.int64)
+        values = np.array(new_values, dtype=np.float64)
+        entry = manifest["metrics"].get(key)
+        if entry:
+            old_timestamps, old_values = _load_series(folder, entry["version"])
+            timestamps = np.concatenate([old_timestamps, timestamps])
+            values = np.concatenate([old_values, values])
+        # Stable sort keeps arrival order of same timestamp, keep last point of each timestamp
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, values = timestamps[order], values[order]
+        keep = np.append(timestamps[1:] != timestamps[:-1], True)
+        timestamps, values = timestamps[keep], values[keep]
+
+        version = f"{UNSAFE_NAME_CHARS.sub('_', key)}-{uuid.uuid4().hex[:12]}"
+        version_folder = os.path.join(folder, version)
+        os.makedirs(version_folder)
+        np.save(os.path.join(version_folder, "timestamps.npy"), timestamps)
+        np.save(os.path.join(version_folder, "values.npy"), values)
+        manifest["metrics"][key] = {
+            "version": version,
+            "points": len(timestamps),
+            "start": int(timestamps[0]),
+            "end": int(timestamps[-1]),
+        }
+
+    for file_url in file_urls:
+        stat = os.stat(file_url)
+        manifest["sources"][file_url] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = os.path.join(folder, "manifest.json.tmp")
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, os.path.join(folder, "manifest.json"))
+    return point_count
+
+
+def percentiles(values: np.ndarray) -> tuple[float, float, float] | None:
+    """p50, p95 and p99 of values, estimated on evenly strided sample for very large windows"""
+    if not len(values):
+        return None
+    if len(values) > PERCENTILE_MAX_POINTS:
+        values = values[:: len(values) // PERCENTILE_MAX_POINTS + 1]
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return float(p50), float(p95), float(p99)
+
+
+def counter_rates(timestamps: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Per second rate between consecutive counter points, counter resets are counted from zero"""
+    increases = np.diff(values)
+    increases = np.where(increases < 0, values[1:], increases)
+    intervals = np.diff(timestamps)
+    return increases / np.maximum(intervals, 1)
+
+
+def change_point(
+    timestamps: np.ndarray, values: np.ndarray
+) -> tuple[int, float, float] | None:
+    """Find split with largest mean shift weighted by segment sizes, return its time and means of
+    both sides. Long series are split at bucket boundaries only, all splits are scored at once
+    with cumulative sums"""
+    count = len(values)
+    if count < CHANGE_POINT_MIN_POINTS:
+        return None
+    starts = np.unique(
+        np.linspace(
+            0, count, min(count, CHANGE_POINT_BUCKETS), endpoint=False
+        ).astype(np.int64)
+    )
+    bucket_sums = np.add.reduceat(values, starts)
+    bucket_counts = np.diff(np.append(starts, count))
+    left_sums = np.cumsum(bucket_sums)[:-1]
+    left_counts = np.cumsum(bucket_counts)[:-1]
+    right_counts = count - left_counts
+    left_means = left_sums / left_counts
+    right_means = (bucket_sums.sum() - left_sums) / right_counts
+    scores = np.abs(left_means - right_means) * np.sqrt(
+        left_counts * right_counts / count
+    )
+    best = int(np.argmax(scores))
+    return (
+        int(timestamps[starts[best + 1]]),
+        float(left_means[best]),
+        float(right_means[best]),
+    )
+
+
+class MetricsStore:
+    """Read side of metrics store, manifest is reloaded after ingestion and series are opened
+    lazily as memory maps"""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._manifest: dict | None = None
+        self._series: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    def open(self):
+        with self._lock:
+            if self._manifest is None:
+                self._manifest = _load_manifest(self.folder)
+
+    def reload(self):
+        manifest = _load_manifest(self.folder)
+        with self._lock:
+            self._manifest = manifest
+            self._series = {}
+
+    def changed_sources(self, file_urls: list[str]) -> list[str]:
+        """Get exported files which are new or changed since they were ingested"""
+        self.open()
+        changed = []
+        for file_url in file_urls:
+            stat = os.stat(file_url)
+            entry = self._manifest["sources"].get(file_url)
+            if (
+                entry is None
+                or entry["size"] != stat.st_size
+                or entry["mtime_ns"] != stat.st_mtime_ns
+            ):
+                changed.append(file_url)
+        return changed
+
+    def series(self, key: str) -> tuple[np.ndarray, np.ndarray]:
+        series = self._series.get(key)
+        if series is None:
+            self.open()
+            try:
+                series = _load_series(
+                    self.folder, self._manifest["metrics"][key]["version"]
+                )
+            except (FileNotFoundError, KeyError):
+                # Manifest is older than ingestion which replaced the version, load current one
+                self.reload()
+                series = _load_series(
+                    self.folder, self._manifest["metrics"][key]["version"]
+                )
+            self._series[key] = series
+        return series
+
+    def find_metrics(
+        self, query: str, service: str = "", limit: int = 5
+    ) -> list[str]:
+        """Find metrics whose names share most words with query, only metrics of service if set"""
+        self.open()
+        terms = set(tokenize(query))
+        service_prefix = f"{service.strip()}/" if service.strip() else ""
+        scored = []
+        for key in self._manifest["metrics"]:
+            if service_prefix and not key.startswith(service_prefix):
+                continue
+            score = len(terms.intersection(tokenize(key)))
+            if score or service_prefix:
+                scored.append((score, key))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [key for _, key in scored[:limit]]
+
+    def summarize(self, key: str, around_time: int | None, window: int) -> str:
+        """Compact summary of metric before and after given time, latest point time is used if not set"""
+        timestamps, values = self.series(key)
+        if around_time is None:
+            around_time = int(timestamps[-1])
+        start = int(np.searchsorted(timestamps, around_time - window, "left"))
+        middle = int(np.searchsorted(timestamps, around_time, "left"))
+        end = int(np.searchsorted(timestamps, around_time + window, "right"))
+        if start == end:
+            return f"{key}: no data points within {window // 60} minutes of incident time"
+
+        window_timestamps = timestamps[start:end]
+        window_values = values[start:end]
+        is_counter = key.endswith(COUNTER_SUFFIXES)
+        if is_counter:
+            window_values = counter_rates(window_timestamps, window_values)
+            window_timestamps = window_timestamps[1:]
+            middle = max(middle - start - 1, 0)
+        else:
+            middle -= start
+
+        label = "rate/s" if is_counter else "value"
+        lines = [f"{key} ({label}, {len(window_values)} points)"]
+        for name, segment in (
+            ("before", window_values[:middle]),
+            ("after", window_values[middle:]),
+        ):
+            stats = percentiles(segment)
+            if stats:
+                lines.append(
+                    f"  {name}: p50={stats[0]:.4g} p95={stats[1]:.4g} p99={stats[2]:.4g}"
+                )
+        detected = change_point(window_timestamps, window_values)
+        if detected and abs(
+            detected[2] - detected[1]
+        ) > CHANGE_POINT_MIN_SHIFT * max(
+            abs(detected[1]), np.finfo(np.float64).eps
+        ):
+            changed_at, before_mean, after_mean = detected
+            changed_at = datetime.fromtimestamp(changed_at, UTC)
+            lines.append(
+                f"  change point at {changed_at.isoformat()}: mean {before_mean:.4g} -> {after_mean:.4g}"
+            )
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        self.open()
+        metrics = self._manifest["metrics"]
+        return {
+            "metrics": len(metrics),
+            "points": sum(entry["points"] for entry in metrics.values()),
+        }
+
+
+metrics_store = MetricsStore(METRICS_STORE_FOLDER)
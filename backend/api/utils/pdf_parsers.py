@@ -0,0 +1,60 @@
+"""CPU bound PDF parsing functions, kept free of app level imports so they can run in worker processes"""
+
+import io
+import tempfile
+
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import pymupdf
+from pdf2image import convert_from_path
+from PIL import Image
+
+
+def parse_pdf_file(file_url: str) -> list[Document]:
+    """Load PDF file page by page and split pages into chunks"""
+    loader = PyMuPDFLoader(
+        file_path=file_url,
+        mode="page",
+        extract_tables="markdown",
+    )
+    raw_docs = loader.load()
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=50, separators=["\n", "."]
+    )
+    return text_splitter.split_documents(raw_docs)
+
+
+def extract_pdf_page_texts(file_url: str) -> list[str]:
+    """Extract plain text of every PDF page"""
+    with pymupdf.open(file_url) as pdf:
+        return [page.get_text() for page in pdf]
+
+
+def render_pdf_pages(
+    file_url: str, dpi: int, image_format: str, quality: int
+) -> list[bytes]:
+    """Render all PDF pages in one pdftoppm run into temporary folder, then compress them into
+    JPEG or WebP images one by one, so only one decoded page is kept in memory at a time"""
+    page_images = []
+    with tempfile.TemporaryDirectory() as output_folder:
+        image_paths = convert_from_path(
+            file_url, dpi=dpi, output_folder=output_folder, paths_only=True
+        )
+        for image_path in image_paths:
+            buffer = io.BytesIO()
+            with Image.open(image_path) as image:
+                image.convert("RGB").save(
+                    buffer, format=image_format.upper(), quality=quality
+                )
+            page_images.append(buffer.getvalue())
+    return page_images
+
+
+def parse_incident_pdf(
+    file_url: str, dpi: int, image_format: str, quality: int
+) -> tuple[list[str], list[bytes]]:
+    """Get text and compressed image of every page of incident document"""
+    page_texts = extract_pdf_page_texts(file_url)
+    page_images = render_pdf_pages(file_url, dpi, image_format, quality)
+    return page_texts, page_images
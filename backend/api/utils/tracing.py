@@ -0,0 +1,324 @@
+"""Lightweight per-request tracing. Spans are kept in context variable, so spans opened in graph
+nodes, worker threads and LLM callbacks nest under span of request that started them. Finished
+traces are exported as OTLP JSON to file and/or OTLP HTTP collector in background thread, and
+durations are kept per span name for latency percentiles by stage"""
+
+import contextlib
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from uuid import UUID
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from api.utils.logger import logger
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "true").lower() == "true"
+# OTLP JSON lines file, one finished trace per line
+TRACE_EXPORT_FILE = os.environ.get("TRACE_EXPORT_FILE", "")
+# OTLP HTTP traces endpoint of local collector, like http://localhost:4318/v1/traces
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "")
+# Latest span durations kept per stage for percentiles
+TRACE_STATS_WINDOW = int(os.environ.get("TRACE_STATS_WINDOW", "1000"))
+TRACE_RECENT_LIMIT = 20
+SERVICE_NAME = "ai-sre-backend"
+
+_current_span: ContextVar["Span | None"] = ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    def __init__(
+        self, name: str, trace_id: str, parent: "Span | None", attributes: dict
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.root: Span = parent.root if parent else self
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.error: str | None = None
+        # Spans of whole trace, only filled on root span
+        self.spans: list[Span] = []
+
+    @property
+    def duration_ms(self) -> float | None:
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_to_attribute(self, key: str, value: int):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error}
+            if self.error
+            else {"code": 1},
+        }
+        if self.parent:
+            span["parentSpanId"] = self.parent.span_id
+        return span
+
+    def to_tree(self, children: dict[str, list["Span"]]) -> dict:
+        return {
+            "name": self.name,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+            "children": [
+                child.to_tree(children)
+                for child in children.get(self.span_id, [])
+            ],
+        }
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """Create spans, export finished traces and keep recent span durations per stage"""
+
+    def __init__(
+        self,
+        enabled: bool,
+        export_file: str,
+        otlp_endpoint: str,
+        stats_window: int,
+    ):
+        self.enabled = enabled
+        self.export_file = export_file
+        self.otlp_endpoint = otlp_endpoint
+        self.stats_window = stats_window
+        self._durations: dict[str, deque[float]] = {}
+        self._recent_traces: deque[Span] = deque(maxlen=TRACE_RECENT_LIMIT)
+        self._lock = threading.Lock()
+        self._exporter = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+            if export_file or otlp_endpoint
+            else None
+        )
+        self.exported = 0
+        self.export_failures = 0
+
+    def start_span(
+        self,
+        name: str,
+        parent: Span | None = None,
+        root: bool = True,
+        **attributes,
+    ) -> Span | None:
+        """Start span under given or current span, new trace is started only if root is allowed"""
+        if not self.enabled:
+            return None
+        parent = parent or _current_span.get()
+        if parent is None and not root:
+            return None
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        span = Span(name, trace_id, parent, attributes)
+        span.root.spans.append(span)
+        return span
+
+    def end_span(self, span: Span, error: str | None = None):
+        span.end_ns = time.time_ns()
+        span.error = error
+        with self._lock:
+            durations = self._durations.get(span.name)
+            if durations is None:
+                durations = deque(maxlen=self.stats_window)
+                self._durations[span.name] = durations
+            durations.append(span.duration_ms)
+        if span.parent is None:
+            self._recent_traces.append(span)
+            if self._exporter:
+                self._exporter.submit(self._export, span)
+
+    def _export(self, root: Span):
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": SERVICE_NAME},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [span.to_otlp() for span in root.spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        body = json.dumps(payload, default=str)
+        try:
+            if self.export_file:
+                with open(self.export_file, "a", encoding="utf-8") as file:
+                    file.write(body + "\n")
+            if self.otlp_endpoint:
+                request = urllib.request.Request(
+                    self.otlp_endpoint,
+                    data=body.encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    method="POST",
+                )
+                with urllib.request.urlopen(request, timeout=5):
+                    pass
+            self.exported += 1
+        except Exception as e:
+            self.export_failures += 1
+            logger.warning(f"Failed to export trace {root.trace_id}: {e}")
+
+    def stage_stats(self) -> dict:
+        """Count, p50, p95 and max duration in milliseconds of latest spans of each stage"""
+        with self._lock:
+            durations = {
+                name: np.array(values)
+                for name, values in self._durations.items()
+            }
+        stats = {}
+        for name in sorted(durations):
+            values = durations[name]
+            p50, p95 = np.percentile(values, [50, 95])
+            stats[name] = {
+                "count": len(values),
+                "p50_ms": round(float(p50), 2),
+                "p95_ms": round(float(p95), 2),
+                "max_ms": round(float(values.max()), 2),
+            }
+        return stats
+
+    def recent_traces(self) -> list[dict]:
+        """Span trees of latest finished traces, latest first"""
+        trees = []
+        for root in reversed(self._recent_traces):
+            children: dict[str, list[Span]] = {}
+            for span in root.spans:
+                if span.parent:
+                    children.setdefault(span.parent.span_id, []).append(span)
+            trees.append({"trace_id": root.trace_id, **root.to_tree(children)})
+        return trees
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "exported": self.exported,
+            "export_failures": self.export_failures,
+        }
+
+    def shutdown(self):
+        if self._exporter:
+            self._exporter.shutdown(wait=True)
+
+
+tracer = Tracer(
+    TRACING_ENABLED, TRACE_EXPORT_FILE, TRACE_OTLP_ENDPOINT, TRACE_STATS_WINDOW
+)
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes) -> Iterator[Span | None]:
+    """Trace block as span of current trace, or as root span of new trace if there is none"""
+    current = tracer.start_span(name, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except Exception as e:
+        error = repr(e)
+        raise
+    except BaseException:
+        current.set_attribute("cancelled", True)
+        raise
+    finally:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Async generator closed from other context, like client disconnected from stream
+            pass
+        tracer.end_span(current, error)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Record every LLM call made within trace as span with token usage, LLM calls outside
+    request traces (like knowledge base ingestion) are ignored"""
+
+    # Called in caller context, so current span is parent of LLM span
+    run_inline = True
+
+    def __init__(self):
+        self._spans: dict[UUID, Span] = {}
+
+    def _start(self, serialized: dict | None, run_id: UUID, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or ""
+        llm_span = tracer.start_span("llm", root=False, model=str(model))
+        if llm_span is not None:
+            self._spans[run_id] = llm_span
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(serialized, run_id, **kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(serialized, run_id, **kwargs)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        llm_span = self._spans.pop(run_id, None)
+        if llm_span is None:
+            return
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+                for key in ("input_tokens", "output_tokens", "total_tokens"):
+                    if usage.get(key):
+                        llm_span.add_to_attribute(key, usage[key])
+                        llm_span.root.add_to_attribute(f"llm_{key}", usage[key])
+        tracer.end_span(llm_span)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs):
+        llm_span = self._spans.pop(run_id, None)
+        if llm_span is not None:
+            tracer.end_span(llm_span, repr(error))
+
+
+tracing_callback_handler = TracingCallbackHandler()
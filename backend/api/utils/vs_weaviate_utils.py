@@ -1,24 +1,28 @@
 """All util classes and functions related to Weaviate vector store"""
 
 import os
+import threading
+import time
 
 import weaviate
 from weaviate import WeaviateClient
 from weaviate.collections import Collection
 from langchain_weaviate import WeaviateVectorStore
-from langchain.retrievers.multi_vector import MultiVectorRetriever
 from langchain.storage import LocalFileStore
 
 from api.utils.llm_google_utils import embedding_function
+from api.utils.logger import logger
 
 TEXT_COLLECTION_NAME = "demo_text_collection"
 SUMMARY_COLLECTION_NAME = "demo_summary_collection"
+INCIDENT_PAGE_COLLECTION_NAME = "demo_incident_page_collection"
+OBJECT_STORE_FOLDER = "./data"
 
 
 EXCESSIVE_ERROR_THRESHOLD = 10
 
 
-def get_client() -> WeaviateClient:
+def create_client() -> WeaviateClient:
     # Weaviate deployed locally in docker, with url: http://localhost:8080
     # If different, here should use different config or function
     host = os.environ.get("WEAVIATE_HOST", "127.0.0.1")
@@ -33,24 +37,117 @@ def get_client() -> WeaviateClient:
     return client
 
 
-def get_weaviate_store(client: WeaviateClient, collection_name: str):
-    return WeaviateVectorStore(
-        client=client,
-        index_name=collection_name,
-        embedding=embedding_function,
-        text_key="text",
+class WeaviateClientManager:
+    """Manage one long-lived Weaviate client shared by whole app, with periodic
+    health check and reconnect when connection is lost"""
+
+    def __init__(self, health_check_interval: float):
+        self.health_check_interval = health_check_interval
+        self._client: WeaviateClient | None = None
+        self._last_health_check = 0.0
+        self._lock = threading.Lock()
+        self.reconnects = 0
+
+    def connect(self) -> WeaviateClient:
+        with self._lock:
+            if self._client is None:
+                self._client = create_client()
+                self._last_health_check = time.monotonic()
+                logger.info("Connected to Weaviate")
+            return self._client
+
+    def _is_healthy(self, client: WeaviateClient) -> bool:
+        try:
+            return client.is_connected() and client.is_ready()
+        except Exception as e:
+            logger.warning(f"Weaviate health check failed: {e}")
+            return False
+
+    def reconnect(self) -> WeaviateClient:
+        with self._lock:
+            self._close_client()
+            self._client = create_client()
+            self._last_health_check = time.monotonic()
+            self.reconnects += 1
+            logger.info("Reconnected to Weaviate")
+            return self._client
+
+    def get_client(self) -> WeaviateClient:
+        """Get shared client, check its health at most once per health check interval"""
+        client = self._client
+        if client is None:
+            return self.connect()
+        now = time.monotonic()
+        if now - self._last_health_check < self.health_check_interval:
+            return client
+        self._last_health_check = now
+        if self._is_healthy(client):
+            return client
+        return self.reconnect()
+
+    def _close_client(self):
+        if self._client is None:
+            return
+        clear_store_cache()
+        try:
+            self._client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close Weaviate client: {e}")
+        self._client = None
+
+    def close(self):
+        with self._lock:
+            self._close_client()
+
+    def stats(self) -> dict:
+        return {
+            "connected": self._client is not None,
+            "reconnects": self.reconnects,
+            "cached_vector_stores": len(_vector_stores),
+        }
+
+
+weaviate_manager = WeaviateClientManager(
+    health_check_interval=float(
+        os.environ.get("WEAVIATE_HEALTH_CHECK_INTERVAL", "30")
     )
+)
+
+# Vector stores are cached per client and collection, rebuilding them checks collection schema every time
+_vector_stores: dict[tuple[int, str], WeaviateVectorStore] = {}
+
 
+def clear_store_cache():
+    _vector_stores.clear()
 
-def get_multi_vector_retriever(
+
+def get_weaviate_store(
     client: WeaviateClient, collection_name: str
-) -> MultiVectorRetriever:
-    vector_store = get_weaviate_store(client, collection_name)
-    object_store = LocalFileStore("./data")
-    id_key = "doc_id"
-
-    return MultiVectorRetriever(
-        vectorstore=vector_store,
-        docstore=object_store,
-        id_key=id_key,
-    )
+) -> WeaviateVectorStore:
+    key = (id(client), collection_name)
+    vector_store = _vector_stores.get(key)
+    if vector_store is None:
+        vector_store = WeaviateVectorStore(
+            client=client,
+            index_name=collection_name,
+            embedding=embedding_function,
+            text_key="text",
+        )
+        _vector_stores[key] = vector_store
+    return vector_store
+
+
+def collection_has_property(
+    client: WeaviateClient, collection_name: str, property_name: str
+) -> bool:
+    """Filter on property not in collection schema is rejected by Weaviate, properties are added
+    by auto schema when first object having them is written"""
+    if not client.collections.exists(collection_name):
+        return False
+    config = client.collections.get(collection_name).config.get()
+    return any(prop.name == property_name for prop in config.properties)
+
+
+def get_object_store() -> LocalFileStore:
+    """Object store to save original documents, like incident document page images"""
+    return LocalFileStore(OBJECT_STORE_FOLDER)
@@ -0,0 +1,82 @@
+"""Measure event loop lag during concurrent logins, with bcrypt verification run inline on event
+loop versus in password hasher thread pool. Run from backend folder:
+
+    python -m benchmarks.password_hashing --logins 20 --rounds 12
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from passlib.context import CryptContext
+
+from api.auth.passwords import PasswordHasher
+
+TICK_SECONDS = 0.005
+
+
+async def measure_lag(stop: asyncio.Event, lags: list[float]):
+    """Sleep in short ticks, lag is how much later than expected each tick wakes up"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(time.perf_counter() - started - TICK_SECONDS)
+
+
+async def run(mode: str, context: CryptContext, hashed: str, args) -> dict:
+    hasher = PasswordHasher(context, args.workers, args.logins)
+
+    async def login():
+        if mode == "inline":
+            context.verify("password", hashed)
+        else:
+            await hasher.verify("password", hashed)
+
+    stop = asyncio.Event()
+    lags: list[float] = []
+    monitor = asyncio.create_task(measure_lag(stop, lags))
+    await asyncio.sleep(TICK_SECONDS * 4)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    hasher.shutdown()
+    lags.sort()
+    return {
+        "mode": mode,
+        "elapsed_s": elapsed,
+        "logins_per_s": args.logins / elapsed,
+        "lag_p50_ms": statistics.median(lags) * 1000,
+        "lag_p99_ms": lags[int(len(lags) * 0.99)] * 1000,
+        "lag_max_ms": lags[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    context = CryptContext(
+        schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=args.rounds
+    )
+    hashed = context.hash("password")
+    print(
+        f"{args.logins} concurrent logins, bcrypt rounds {args.rounds}, {args.workers} workers"
+    )
+    for mode in ("inline", "executor"):
+        result = asyncio.run(run(mode, context, hashed, args))
+        print(
+            f"{result['mode']:>8}: {result['elapsed_s']:.2f}s "
+            f"({result['logins_per_s']:.1f} logins/s), event loop lag "
+            f"p50 {result['lag_p50_ms']:.1f} ms, p99 {result['lag_p99_ms']:.1f} ms, "
+            f"max {result['lag_max_ms']:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import pytest
+
+from api.ai_sre import answer_cache as answer_cache_module
+from api.ai_sre.answer_cache import SemanticAnswerCache
+
+VECTORS = {
+    "why is checkout slow": [1.0, 0.0, 0.0],
+    "why is the checkout slow": [0.99, 0.01, 0.0],
+    "how do I rotate keys": [0.0, 1.0, 0.0],
+    "what is the error budget": [0.0, 0.0, 1.0],
+}
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    async def aembed_query(self, query: str) -> list[float]:
+        self.calls += 1
+        if query not in VECTORS:
+            raise RuntimeError("embedding API unavailable")
+        return VECTORS[query]
+
+
+@pytest.fixture
+def embeddings(monkeypatch) -> FakeEmbeddings:
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(answer_cache_module, "embedding_function", fake)
+    return fake
+
+
+def make_cache(**kwargs) -> SemanticAnswerCache:
+    settings = {
+        "enabled": True,
+        "similarity_threshold": 0.95,
+        "ttl_seconds": 600,
+        "max_entries": 10,
+    }
+    settings.update(kwargs)
+    return SemanticAnswerCache(**settings)
+
+
+async def test_similar_query_hits_cached_completion(embeddings):
+    cache = make_cache()
+    await cache.store("why is checkout slow", "DB pool exhausted")
+
+    assert await cache.lookup("why is the checkout slow") == "DB pool exhausted"
+    assert await cache.lookup("how do I rotate keys") is None
+    assert cache.stats() == {
+        "enabled": True,
+        "entries": 1,
+        "hits": 1,
+        "misses": 1,
+    }
+
+
+async def test_empty_cache_does_not_embed_query(embeddings):
+    cache = make_cache()
+
+    assert await cache.lookup("why is checkout slow") is None
+    assert embeddings.calls == 0
+
+
+async def test_expired_completion_is_not_returned(embeddings, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache_module.time, "monotonic", lambda: now[0])
+    cache = make_cache(ttl_seconds=60)
+    await cache.store("why is checkout slow", "DB pool exhausted")
+
+    now[0] += 61
+    assert await cache.lookup("why is checkout slow") is None
+    assert cache.stats()["entries"] == 0
+
+
+async def test_oldest_completion_is_evicted_over_max_entries(embeddings):
+    cache = make_cache(max_entries=2)
+    await cache.store("why is checkout slow", "answer 1")
+    await cache.store("how do I rotate keys", "answer 2")
+    await cache.store("what is the error budget", "answer 3")
+
+    assert await cache.lookup("why is checkout slow") is None
+    assert await cache.lookup("how do I rotate keys") == "answer 2"
+    assert await cache.lookup("what is the error budget") == "answer 3"
+
+
+async def test_embedding_failure_is_cache_miss(embeddings):
+    cache = make_cache()
+    await cache.store("why is checkout slow", "DB pool exhausted")
+    await cache.store("unknown question", "not stored")
+
+    assert await cache.lookup("unknown question") is None
+    assert cache.stats()["entries"] == 1
+
+
+async def test_invalidate_drops_all_completions(embeddings):
+    cache = make_cache()
+    await cache.store("why is checkout slow", "DB pool exhausted")
+    cache.invalidate()
+
+    assert await cache.lookup("why is checkout slow") is None
+    assert cache.stats()["entries"] == 0
+
+
+async def test_disabled_cache_never_stores(embeddings):
+    cache = make_cache(enabled=False)
+    await cache.store("why is checkout slow", "DB pool exhausted")
+
+    assert await cache.lookup("why is checkout slow") is None
+    assert embeddings.calls == 0
+
+
+async def test_invalidate_while_embedding_query_is_cache_miss(embeddings):
+    cache = make_cache()
+    await cache.store("why is checkout slow", "DB pool exhausted")
+    aembed_query = embeddings.aembed_query
+
+    async def invalidate_then_embed(query: str) -> list[float]:
+        cache.invalidate()
+        return await aembed_query(query)
+
+    embeddings.aembed_query = invalidate_then_embed
+
+    assert await cache.lookup("why is checkout slow") is None
+    assert cache.stats()["misses"] == 1
+
+
+async def test_completion_computed_before_invalidate_is_not_stored(embeddings):
+    cache = make_cache()
+    generation = cache.generation
+    cache.invalidate()
+
+    await cache.store("why is checkout slow", "stale answer", generation)
+
+    assert cache.stats()["entries"] == 0
+    await cache.store("why is checkout slow", "fresh answer", cache.generation)
+    assert await cache.lookup("why is checkout slow") == "fresh answer"
@@ -0,0 +1,166 @@
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+
+from api.ai_sre import chat_memory
+from api.ai_sre.models import RoleTypes
+
+
+class FakeChatStore:
+    """Chats and summary of one user, stands in for chats and chat_summaries tables"""
+
+    def __init__(self):
+        self.chats = []
+        self.summary = None
+        self.summary_calls = 0
+
+    def add_pairs(self, count: int, content: str = "short"):
+        for _ in range(count):
+            for role_type in (RoleTypes.HUMAN, RoleTypes.AI):
+                self.chats.append(
+                    SimpleNamespace(
+                        id=len(self.chats) + 1,
+                        role_type=role_type,
+                        content=content,
+                    )
+                )
+
+    async def find_recent_chat_history(self, db, user_id, limit, after_id=None):
+        chats = [chat for chat in self.chats if chat.id > (after_id or 0)]
+        return chats[-limit:]
+
+    async def find_chats_between(self, db, user_id, after_id, before_id, limit):
+        return [chat for chat in self.chats if after_id < chat.id < before_id][
+            :limit
+        ]
+
+    async def find_by_userid(self, db, user_id):
+        return self.summary
+
+    async def save(self, db, user_id, summary, summarized_until_id):
+        self.summary = SimpleNamespace(
+            summary=summary, summarized_until_id=summarized_until_id
+        )
+
+    def summarize(self, prompt_value) -> AIMessage:
+        self.summary_calls += 1
+        return AIMessage(content=f"summary {self.summary_calls}")
+
+
+@pytest.fixture
+def store(monkeypatch) -> FakeChatStore:
+    fake = FakeChatStore()
+    monkeypatch.setattr(
+        chat_memory.ChatModel,
+        "find_recent_chat_history",
+        fake.find_recent_chat_history,
+    )
+    monkeypatch.setattr(
+        chat_memory.ChatModel, "find_chats_between", fake.find_chats_between
+    )
+    monkeypatch.setattr(
+        chat_memory.ChatSummary, "find_by_userid", fake.find_by_userid
+    )
+    monkeypatch.setattr(chat_memory.ChatSummary, "save", fake.save)
+    monkeypatch.setattr(chat_memory, "llm", RunnableLambda(fake.summarize))
+
+    @contextlib.asynccontextmanager
+    async def session():
+        yield None
+
+    monkeypatch.setattr(chat_memory.session_manager, "session", session)
+    monkeypatch.setattr(chat_memory, "CHAT_MEMORY_MAX_CHATS", 20)
+    monkeypatch.setattr(chat_memory, "CHAT_MEMORY_TOKEN_BUDGET", 1500)
+    monkeypatch.setattr(chat_memory, "CHAT_SUMMARY_MIN_TOKENS", 500)
+    return fake
+
+
+async def load_and_summarize(store: FakeChatStore) -> chat_memory.ChatMemory:
+    memory = await chat_memory.load_chat_memory(None, user_id=1)
+    if memory.evicted_chats:
+        await chat_memory.update_chat_summary(1, memory)
+    return memory
+
+
+def evicted_ids(memory: chat_memory.ChatMemory) -> list[int]:
+    return [chat_id for chat_id, _, _ in memory.evicted_chats]
+
+
+async def test_short_chats_beyond_loaded_window_are_summarized(store):
+    store.add_pairs(15)
+
+    memory = await load_and_summarize(store)
+
+    # Loaded window holds newest 20 chats, older 10 are too few tokens to summarize on their
+    # own but are folded anyway, otherwise next summary would skip them
+    assert evicted_ids(memory) == list(range(1, 11))
+    assert len(memory.messages) == 20
+    assert isinstance(memory.messages[0], HumanMessage)
+    assert store.summary.summarized_until_id == 10
+
+    memory = await load_and_summarize(store)
+
+    assert memory.evicted_chats == []
+    assert (
+        memory.messages[0].content
+        == "Summary of earlier conversation: summary 1"
+    )
+    assert len(memory.messages) == 21
+    assert store.summary_calls == 1
+
+
+async def test_large_backlog_is_summarized_oldest_first_without_gaps(store):
+    store.add_pairs(30)
+
+    folded = []
+    for _ in range(3):
+        memory = await load_and_summarize(store)
+        folded.extend(evicted_ids(memory))
+        # Window is always newest 20 chats, whatever is left in backlog
+        chat_messages = [
+            message
+            for message in memory.messages
+            if not isinstance(message, SystemMessage)
+        ]
+        assert len(chat_messages) == 20
+
+    assert folded == list(range(1, 41))
+    assert store.summary.summarized_until_id == 40
+
+
+async def test_chats_out_of_token_budget_are_evicted(store):
+    store.add_pairs(3, content="x" * 2000)
+
+    memory = await load_and_summarize(store)
+
+    # 500 tokens each, only last two fit budget
+    assert evicted_ids(memory) == [1, 2, 3, 4]
+    assert [type(message) for message in memory.messages] == [
+        HumanMessage,
+        AIMessage,
+    ]
+    assert store.summary.summarized_until_id == 4
+
+
+async def test_few_evicted_tokens_wait_for_later_summary(store, monkeypatch):
+    monkeypatch.setattr(chat_memory, "CHAT_MEMORY_TOKEN_BUDGET", 5)
+    store.add_pairs(3)
+
+    memory = await load_and_summarize(store)
+
+    assert memory.evicted_chats == []
+    assert len(memory.messages) == 6
+    assert store.summary_calls == 0
+
+
+async def test_summary_already_updated_by_concurrent_request_is_kept(store):
+    store.add_pairs(3, content="x" * 2000)
+    memory = await chat_memory.load_chat_memory(None, user_id=1)
+    await store.save(None, 1, "newer summary", 4)
+
+    await chat_memory.update_chat_summary(1, memory)
+
+    assert store.summary.summary == "newer summary"
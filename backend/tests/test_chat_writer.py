@@ -0,0 +1,151 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from api.ai_sre import chat_writer as chat_writer_module
+from api.ai_sre.chat_writer import ChatWriter
+
+
+class FakeChatTable:
+    """Record written batches, writes block while paused and fail while failing"""
+
+    def __init__(self):
+        self.batches = []
+        self.sessions = []
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        self.failing = False
+
+    async def create_pairs(self, db, pairs):
+        await self.resumed.wait()
+        if self.failing:
+            raise RuntimeError("DB unavailable")
+        self.sessions.append(db)
+        self.batches.append(list(pairs))
+
+    @property
+    def pairs(self) -> list:
+        return [pair for batch in self.batches for pair in batch]
+
+
+@pytest.fixture
+def table(monkeypatch) -> FakeChatTable:
+    fake = FakeChatTable()
+    monkeypatch.setattr(
+        chat_writer_module.ChatModel, "create_pairs", fake.create_pairs
+    )
+
+    @contextlib.asynccontextmanager
+    async def session():
+        yield "worker session"
+
+    monkeypatch.setattr(chat_writer_module.session_manager, "session", session)
+    return fake
+
+
+async def test_direct_write_uses_request_session(table):
+    writer = ChatWriter(write_behind=False, queue_size=10, batch_size=10)
+    writer.start()
+
+    await writer.save_pair(1, "question", "answer", db="request session")
+
+    assert table.batches == [[(1, "question", "answer")]]
+    assert table.sessions == ["request session"]
+    assert writer.stats()["written_pairs"] == 1
+
+
+async def test_queued_pairs_are_written_in_batches_and_drained_on_stop(table):
+    writer = ChatWriter(write_behind=True, queue_size=10, batch_size=3)
+    writer.start()
+    table.resumed.clear()
+
+    for index in range(7):
+        await writer.save_pair(1, f"question {index}", f"answer {index}")
+    # Nothing written until worker gets DB back
+    assert table.batches == []
+    assert writer.stats()["queued"] > 0
+
+    table.resumed.set()
+    await writer.stop()
+
+    assert [pair[1] for pair in table.pairs] == [
+        f"question {index}" for index in range(7)
+    ]
+    assert all(len(batch) <= 3 for batch in table.batches)
+    assert len(table.batches) < 7
+    assert set(table.sessions) == {"worker session"}
+
+
+async def test_full_queue_writes_directly(table):
+    writer = ChatWriter(write_behind=True, queue_size=1, batch_size=10)
+    writer.start()
+    table.resumed.clear()
+    await writer.save_pair(1, "queued", "answer")
+    # Let worker take first pair, so it blocks on paused write and queue can fill up
+    await asyncio.sleep(0)
+    await writer.save_pair(1, "queued too", "answer")
+
+    direct = asyncio.create_task(
+        writer.save_pair(1, "direct", "answer", db="request session")
+    )
+    await asyncio.sleep(0)
+    table.resumed.set()
+    await direct
+    await writer.stop()
+
+    assert sorted(pair[1] for pair in table.pairs) == [
+        "direct",
+        "queued",
+        "queued too",
+    ]
+    assert "request session" in table.sessions
+
+
+async def test_flush_user_waits_for_queued_pairs_of_user(table):
+    writer = ChatWriter(write_behind=True, queue_size=10, batch_size=10)
+    writer.start()
+    table.resumed.clear()
+    await writer.save_pair(1, "question", "answer")
+
+    flush = asyncio.create_task(writer.flush_user(1))
+    await asyncio.sleep(0.01)
+    assert not flush.done()
+    # Other users have nothing queued, no wait
+    await asyncio.wait_for(writer.flush_user(2), 0.1)
+
+    table.resumed.set()
+    await asyncio.wait_for(flush, 1)
+    assert table.pairs == [(1, "question", "answer")]
+    await writer.stop()
+
+
+async def test_flush_user_gives_up_after_timeout(table, monkeypatch):
+    monkeypatch.setattr(
+        chat_writer_module, "CHAT_WRITE_FLUSH_TIMEOUT_SECONDS", 0.01
+    )
+    writer = ChatWriter(write_behind=True, queue_size=10, batch_size=10)
+    writer.start()
+    table.resumed.clear()
+    await writer.save_pair(1, "question", "answer")
+
+    await asyncio.wait_for(writer.flush_user(1), 1)
+
+    table.resumed.set()
+    await writer.stop()
+
+
+async def test_failed_batch_does_not_stop_worker(table):
+    writer = ChatWriter(write_behind=True, queue_size=10, batch_size=10)
+    writer.start()
+    table.failing = True
+    await writer.save_pair(1, "lost", "answer")
+    await writer.flush_user(1)
+
+    table.failing = False
+    await writer.save_pair(1, "kept", "answer")
+    await writer.stop()
+
+    assert table.pairs == [(1, "kept", "answer")]
+    assert writer.stats()["failed_pairs"] == 1
+    assert writer.stats()["written_pairs"] == 1
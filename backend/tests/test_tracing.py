@@ -0,0 +1,159 @@
+import json
+import time
+import uuid
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from api.utils import tracing
+from api.utils.tracing import Tracer, TracingCallbackHandler, span
+
+
+@pytest.fixture
+def tracer(monkeypatch) -> Tracer:
+    fresh = Tracer(
+        enabled=True, export_file="", otlp_endpoint="", stats_window=100
+    )
+    monkeypatch.setattr(tracing, "tracer", fresh)
+    return fresh
+
+
+def llm_result(input_tokens: int, output_tokens: int) -> LLMResult:
+    message = AIMessage(
+        content="answer",
+        usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        },
+    )
+    return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+
+def test_nested_spans_belong_to_one_trace(tracer):
+    with span("request", user_id=1) as root:
+        with span("retrieval") as child:
+            with span("embedding") as grandchild:
+                pass
+
+    assert child.parent is root
+    assert grandchild.parent is child
+    assert {child.trace_id, grandchild.trace_id} == {root.trace_id}
+    assert root.spans == [root, child, grandchild]
+    [trace] = tracer.recent_traces()
+    assert trace["trace_id"] == root.trace_id
+    assert trace["attributes"] == {"user_id": 1}
+    assert trace["children"][0]["name"] == "retrieval"
+    assert trace["children"][0]["children"][0]["name"] == "embedding"
+
+
+def test_span_records_error_and_reraises(tracer):
+    with pytest.raises(ValueError), span("request") as root:
+        raise ValueError("boom")
+
+    assert root.error == "ValueError('boom')"
+    assert root.to_otlp()["status"] == {"code": 2, "message": root.error}
+
+
+def test_disabled_tracer_records_nothing(tracer):
+    tracer.enabled = False
+
+    with span("request") as root:
+        pass
+
+    assert root is None
+    assert tracer.stage_stats() == {}
+
+
+def test_stage_stats_reports_percentiles_per_stage(tracer):
+    for duration_ms in range(1, 101):
+        stage_span = tracer.start_span("db")
+        stage_span.start_ns = time.time_ns() - duration_ms * 1_000_000
+        tracer.end_span(stage_span)
+
+    stats = tracer.stage_stats()["db"]
+
+    assert stats["count"] == 100
+    assert stats["p50_ms"] == pytest.approx(50.5, abs=1)
+    assert stats["p95_ms"] == pytest.approx(95.05, abs=1)
+    assert stats["max_ms"] == pytest.approx(100, abs=1)
+
+
+def test_llm_calls_are_traced_with_token_usage(tracer):
+    handler = TracingCallbackHandler()
+
+    with span("request") as root:
+        for input_tokens in (100, 50):
+            run_id = uuid.uuid4()
+            handler.on_chat_model_start(
+                {},
+                [],
+                run_id=run_id,
+                invocation_params={"model": "gemini"},
+            )
+            handler.on_llm_end(llm_result(input_tokens, 10), run_id=run_id)
+
+    llm_spans = [child for child in root.spans if child.name == "llm"]
+    assert [child.parent for child in llm_spans] == [root, root]
+    assert llm_spans[0].attributes == {
+        "model": "gemini",
+        "input_tokens": 100,
+        "output_tokens": 10,
+        "total_tokens": 110,
+    }
+    assert root.attributes == {
+        "llm_input_tokens": 150,
+        "llm_output_tokens": 20,
+        "llm_total_tokens": 170,
+    }
+    assert tracer.stage_stats()["llm"]["count"] == 2
+
+
+def test_llm_error_ends_span_with_error(tracer):
+    handler = TracingCallbackHandler()
+
+    with span("request") as root:
+        run_id = uuid.uuid4()
+        handler.on_llm_start({}, ["prompt"], run_id=run_id)
+        handler.on_llm_error(RuntimeError("quota"), run_id=run_id)
+
+    [llm_span] = [child for child in root.spans if child.name == "llm"]
+    assert llm_span.error == "RuntimeError('quota')"
+
+
+def test_llm_calls_outside_trace_are_ignored(tracer):
+    handler = TracingCallbackHandler()
+    run_id = uuid.uuid4()
+
+    handler.on_chat_model_start({}, [], run_id=run_id)
+    handler.on_llm_end(llm_result(100, 10), run_id=run_id)
+
+    assert tracer.stage_stats() == {}
+    assert tracer.recent_traces() == []
+
+
+def test_finished_trace_is_exported_as_otlp_json(monkeypatch, tmp_path):
+    export_file = tmp_path / "traces.jsonl"
+    exporting = Tracer(
+        enabled=True,
+        export_file=str(export_file),
+        otlp_endpoint="",
+        stats_window=100,
+    )
+    monkeypatch.setattr(tracing, "tracer", exporting)
+
+    with span("request") as root, span("retrieval", hits=3):
+        pass
+    exporting.shutdown()
+
+    [line] = export_file.read_text().splitlines()
+    [resource_spans] = json.loads(line)["resourceSpans"]
+    spans = resource_spans["scopeSpans"][0]["spans"]
+    assert [exported["name"] for exported in spans] == ["request", "retrieval"]
+    assert {exported["traceId"] for exported in spans} == {root.trace_id}
+    assert spans[1]["parentSpanId"] == root.span_id
+    assert spans[1]["attributes"] == [
+        {"key": "hits", "value": {"intValue": "3"}}
+    ]
+    assert exporting.stats()["exported"] == 1
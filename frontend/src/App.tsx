@@ -10,6 +10,7 @@ import './App.css';
 function App() {
   const [query, setQuery] = useState('')
   const [chatHistory, setChatHistory] = useState<ChatRecord[]>([])
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null)
   const [runningIngestion, setRunningIngestion] = useState(false)
   const messageEndRef = useRef(null)
   const auth = useAuth()
@@ -26,6 +27,7 @@ function App() {
       });
       const data = await res.json();
       setChatHistory(data.chat_history)
+      setHistoryCursor(data.next_cursor)
     }
     load_chat_history()
   }, [auth.token, baseUrl])
@@ -69,16 +71,48 @@ function App() {
       method: "POST",
       headers: { Authorization: `Bearer ${auth.token}` },
     });
-    const result = await res.json()
+    let result = await res.json()
+    if (res.status !== 202) {
+      setRunningIngestion(false)
+      alert(`Error happened when generating knowledgebase:\n ${result?.detail || res.status}`);
+      return
+    }
+    // Ingestion runs as background job in backend, poll its status until it is finished
+    while (result.status === 'queued' || result.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, 2000))
+      const jobRes = await fetch(`${baseUrl}/gen-knowledgebase/${result.job_id}`, {
+        method: "GET",
+        headers: { Authorization: `Bearer ${auth.token}` },
+      });
+      if (jobRes.status !== 200) {
+        setRunningIngestion(false)
+        alert(`Error happened when generating knowledgebase:\n ${jobRes.status}`);
+        return
+      }
+      result = await jobRes.json()
+    }
     setRunningIngestion(false)
-    if (res.status === 200 && result.status === 'Success') {
+    if (result.status === 'succeeded') {
       alert("Successfully generate knowledgebase in backend!");
     } else {
-      const errMessage = result?.error || res.status
+      const errMessage = result?.errors?.join('\n') || result.status
       alert(`Error happened when generating knowledgebase:\n ${errMessage}`);
     }
   }
 
+  const handleLoadEarlierChats = async () => {
+    if (!historyCursor) {
+      return
+    }
+    const res = await fetch(`${baseUrl}/chat-history?before=${encodeURIComponent(historyCursor)}`, {
+      method: "GET",
+      headers: { "content-Type": "application/json", Authorization: `Bearer ${auth.token}` },
+    });
+    const data = await res.json();
+    setChatHistory([...data.chat_history, ...chatHistory])
+    setHistoryCursor(data.next_cursor)
+  }
+
   const handleLogout = () => {
     auth.logout()
   }
@@ -107,6 +141,11 @@ function App() {
         </div>
       </div>
       <div className='chat-history'>
+        {historyCursor && (
+          <Button size='small' onClick={handleLoadEarlierChats}>
+            Load earlier chats
+          </Button>
+        )}
         {chatHistory?.map((record, index) => (
           <div key={index} className='chat-container'>
             {record.role_type === "ai" ? <SmartToy className='ai-logo' /> : <AccountCircle className='human-logo' />}